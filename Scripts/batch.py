@@ -0,0 +1,142 @@
+from chain import Chain
+from fasta_parser import fasta_sequences, hydrophobic_residues, read_record, record_count, to_hp
+from codec import encode, to_bytes
+import argparse
+import json
+import time
+from multiprocessing import Pool
+
+
+def fold_sequence(task):
+    """
+    Fold one sequence with one seed. Used by the worker processes.
+
+    Args:
+    - task (tuple): Record identifier, HP sequence, seed, number of iterations, initialization method,
+    temperature, target energy (None to always run every iteration) and error. If the HP sequence is None,
+    the record identifier is (FASTA file, record number, hydrophobicity table) and the worker reads the record
+    itself with the offset index. If error is not None, the record could not be read and is not folded.
+
+    Returns:
+    - dict: Result record with the best energy, the best coordinates, their canonical code (see codec.py)
+    and the timings, or the identifier of the record and the error message for an invalid record.
+
+    """
+    record_id, hp_sequence, seed, iterations, init_method, temperature, target_energy, error = task
+    start = time.perf_counter()
+    if error is None and hp_sequence is None:
+        fasta_input, k, table = record_id
+        try:
+            record_id, hp_sequence = read_record(fasta_input, k, table)
+        except (ValueError, IndexError) as read_error:
+            record_id, error = f"record {k}", str(read_error)
+    if error is not None:
+        return {"id": record_id, "seed": seed, "error": error}
+    chain = Chain(hp_sequence, seed=seed)
+    chain.initialize(init_method)
+    initialized = time.perf_counter()
+    accepted = chain.run(iterations, temperature, target_energy)
+    finished = time.perf_counter()
+
+    xcoords, ycoords = chain.best_conformation
+    return {
+        "id": record_id,
+        "seed": seed,
+        "length": len(hp_sequence),
+        "best_energy": chain.best_energy,
+        "final_energy": chain.total_energy,
+        "accepted_moves": accepted,
+        "best_coordinates": list(zip(xcoords, ycoords)),
+        "best_code": to_bytes(encode(xcoords, ycoords), len(hp_sequence)).hex(),
+        "init_time": initialized - start,
+        "run_time": finished - initialized,
+    }
+
+
+def batch_tasks(fasta_input, seeds, iterations, init_method, temperature, first_seed=0, target_energy=None,
+                table="default", index=False):
+    """Generate the tasks of every record of a FASTA file, n seeds per record. The file is read lazily so
+    that the workers start on the first records while the next ones are being parsed. With index, only the
+    record numbers are sent and every worker seeks to its record in the file. The tasks of an invalid record
+    carry its error instead of a sequence, so that the other records are still folded"""
+    if index:
+        records = (((fasta_input, k, table), None, None) for k in range(record_count(fasta_input)))
+    else:
+        records = _converted_records(fasta_input, table)
+    for record_id, hp_sequence, error in records:
+        for seed in range(first_seed, first_seed + seeds):
+            yield record_id, hp_sequence, seed, iterations, init_method, temperature, target_energy, error
+
+
+def _converted_records(fasta_input, table):
+    """(identifier, HP sequence, error) of every record of a FASTA file, the error message is None for the
+    valid records"""
+    for record_id, sequence in fasta_sequences(fasta_input):
+        try:
+            yield record_id, to_hp(sequence, table, record_id), None
+        except ValueError as error:
+            yield record_id, "", str(error)
+
+
+def run_batch(tasks, output, workers=1, chunksize=1):
+    """
+    Fold every task on a pool of worker processes and write one JSON line per result, in completion order.
+    The invalid records get a line with their identifier and the error message.
+
+    Args:
+    - tasks (iterable): Tasks as generated by batch_tasks().
+    - output (str): Name of the JSON lines file to write.
+    - workers (int): Number of worker processes, 1 folds in this process.
+    - chunksize (int): Number of tasks sent at once to a worker.
+
+    Returns:
+    - int: Number of results written.
+
+    """
+    written = 0
+    with open(output, "w") as filout:
+        if workers > 1:
+            with Pool(workers) as pool:
+                for result in pool.imap_unordered(fold_sequence, tasks, chunksize):
+                    filout.write(json.dumps(result) + "\n")
+                    written += 1
+        else:
+            for result in map(fold_sequence, tasks):
+                filout.write(json.dumps(result) + "\n")
+                written += 1
+    return written
+
+
+if __name__ == "__main__":
+    pa = argparse.ArgumentParser(description=("Program to fold every protein of a multi-FASTA file"))
+    pa.usage = "batch.py fasta_input iterations init_method --seeds N --workers N"
+    pa.add_argument("fasta_input", type=str, help="Name of the FASTA file, one protein per record")
+    pa.add_argument("iterations", type=int, help="Number of tries to move an amino acid, per run")
+    pa.add_argument("init_method", type=str,
+                    help="Initialization method, should be either linear or random")
+    pa.add_argument("--hp-table", type=str, default="default",
+                    help=("hydrophobicity table: default, kyte-doolittle, or residues: followed by the "
+                          "hydrophobic residues, e.g. residues:AILMFVW"))
+    pa.add_argument("--index", action="store_true",
+                    help=("build an offset index of the FASTA file (FILE.idx) and let the workers read their records"))
+    pa.add_argument("--seeds", type=int, default=1, help=("number of independent runs per sequence"))
+    pa.add_argument("--first-seed", type=int, default=0, help=("seed of the first run of each sequence"))
+    pa.add_argument("--workers", type=int, default=1, help=("number of worker processes"))
+    pa.add_argument("--chunksize", type=int, default=1, help=("number of runs sent at once to a worker"))
+    pa.add_argument("--temp", type=float, default=None,
+                    help=("temperature (K) of the Metropolis criterion, to get out of energy wells"))
+    pa.add_argument("--target-energy", type=int, default=None,
+                    help=("stop a run as soon as this energy is reached"))
+    pa.add_argument("-o", "--output", type=str, default="./Results/batch.jsonl",
+                    help=("JSON lines file receiving one result per sequence and seed"))
+    args = pa.parse_args()
+
+    try:
+        hydrophobic_residues(args.hp_table)
+    except ValueError as error:
+        pa.error(str(error))
+    tasks = batch_tasks(args.fasta_input, args.seeds, args.iterations, args.init_method, args.temp,
+                        args.first_seed, args.target_energy, args.hp_table, args.index)
+    start = time.perf_counter()
+    written = run_batch(tasks, args.output, args.workers, args.chunksize)
+    print(f"\n{written} runs written to {args.output} in {time.perf_counter() - start:.1f} s\n")
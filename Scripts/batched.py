@@ -0,0 +1,263 @@
+from chain import K_B
+from fasta_parser import fasta_read
+from saw import random_walks
+import argparse
+import random
+import sys
+import numpy as np
+
+# Relative coordinates of the 4 lattice sites next to a site
+DIRECTIONS = np.array([(1, 0), (-1, 0), (0, 1), (0, -1)], dtype=np.int64)
+# Free sites kept between a conformation and the border of its grid, a move reaches at most 1 site outside the
+# bounding box of the conformation and the contacts are looked for 1 site further
+GRID_MARGIN = 2
+# Largest memory (bytes) taken by the occupancy grids of a batch
+MAX_GRID_MEMORY = 2 ** 31
+
+
+class BatchedChains(object):
+    """
+        B independent conformations of the same sequence, moved in lockstep with NumPy.
+
+        Every step proposes one move per conformation (end, corner or crankshaft move of a random amino acid),
+        scores the energy changes with array operations on per-conformation occupancy grids and accepts or
+        rejects all the moves in one vectorised Metropolis step. The proposals are symmetric, so the sampling
+        follows the Boltzmann distribution at the temperature of each conformation, which can differ between
+        conformations (e.g. the replicas of a temperature ladder).
+
+        A conformation is never wider than its length N, so each grid has N + 2 * GRID_MARGIN + 2 sites per side
+        and the conformations drifting to the border are moved back to the center. Grids hold int16 values
+        below 32767 amino acids, the grids of the batch take about B * (N + 6)^2 * 2 bytes, e.g. 112 MB for 1000
+        conformations of 231 amino acids.
+
+        Attributes:
+        - positions: Coordinates of the amino acids, shape (B, N, 2).
+        - grids: Occupancy grids, index of the amino acid + 1 on each site and 0 on empty sites, shape (B, G, G).
+        - energies: Energy of each conformation, shape (B,).
+        - temperatures: Temperature (K) of each conformation, 0 for greedy descent, shape (B,).
+        - best_energies, best_positions: Lowest energy conformation seen by each chain.
+
+        Methods:
+        - step(): Try one move on every conformation.
+        - run(n_steps): Try n_steps moves on every conformation.
+        - total_energies(): Calculate the energy of every conformation from scratch.
+        - conformation(k): Get the coordinates of a conformation as (xcoords, ycoords).
+
+        """
+
+    def __init__(self, hp_sequence, n_chains, temperatures=0, seed=None, conformations=None, crankshaft_rate=0.3,
+                 max_memory=MAX_GRID_MEMORY):
+        """
+            Create n_chains conformations of an HP sequence.
+
+            Args:
+            - hp_sequence (str): The HP sequence.
+            - n_chains (int): Number of conformations moved together.
+            - temperatures (float or sequence): Temperature of every conformation, 0 for greedy descent.
+            - seed (int): Seed of the random generator.
+            - conformations (list): Optional starting (xcoords, ycoords) of each conformation, linear otherwise.
+            - crankshaft_rate (float): Probability to propose a crankshaft move instead of an end or corner move.
+            - max_memory (int): Largest memory (bytes) of the occupancy grids, a ValueError is raised above it.
+
+            """
+        self.size = len(hp_sequence)
+        if self.size < 4:
+            raise ValueError("Batched chains need at least 4 amino acids")
+        self.n_chains = n_chains
+        self.hp = np.array([char == 'H' for char in hp_sequence], dtype=bool)
+        self.rng = np.random.default_rng(seed)
+        self.crankshaft_rate = crankshaft_rate
+        self.temperatures = np.broadcast_to(np.asarray(temperatures, dtype=float), (n_chains,)).copy()
+        # The chain is never wider than its length, the margin leaves room for one move before being recentered
+        self.grid_size = self.size + 2 * GRID_MARGIN + 2
+        self._margin = GRID_MARGIN
+        grid_dtype = np.int16 if self.size < np.iinfo(np.int16).max else np.int32
+        grid_memory = n_chains * self.grid_size ** 2 * np.dtype(grid_dtype).itemsize
+        if grid_memory > max_memory:
+            raise ValueError(f"The grids of {n_chains} conformations of {self.size} amino acids would take "
+                             f"{grid_memory / 2 ** 20:.0f} MB, more than {max_memory / 2 ** 20:.0f} MB")
+        self._chain_ids = np.arange(n_chains)
+
+        self.positions = np.zeros((n_chains, self.size, 2), dtype=np.int64)
+        if conformations is None:
+            self.positions[:, :, 0] = np.arange(self.size)
+        else:
+            for k, (xcoords, ycoords) in enumerate(conformations):
+                self.positions[k, :, 0] = xcoords
+                self.positions[k, :, 1] = ycoords
+        self.grids = np.zeros((n_chains, self.grid_size, self.grid_size), dtype=grid_dtype)
+        self._recenter(self._chain_ids)
+        self.energies = self.total_energies()
+        self.best_energies = self.energies.copy()
+        self.best_positions = self.positions.copy()
+
+    def _recenter(self, chain_ids):
+        """Move the given conformations to the center of their grid and rebuild the grids"""
+        positions = self.positions[chain_ids]
+        shift = self.grid_size // 2 - (positions.min(axis=1) + positions.max(axis=1)) // 2
+        positions += shift[:, None, :]
+        self.positions[chain_ids] = positions
+        self.grids[chain_ids] = 0
+        ids = np.repeat(chain_ids, self.size)
+        self.grids[ids, positions[:, :, 0].ravel(), positions[:, :, 1].ravel()] = np.tile(
+            np.arange(1, self.size + 1, dtype=self.grids.dtype), len(chain_ids))
+
+    def total_energies(self):
+        """Calculate the energy of every conformation from scratch, -1 per HH contact between amino acids that
+        are not consecutive in the chain"""
+        contacts = np.zeros(self.n_chains, dtype=np.int64)
+        indices = np.arange(self.size)
+        for direction in DIRECTIONS:
+            sites = self.positions + direction
+            neighbors = self.grids[self._chain_ids[:, None], sites[:, :, 0], sites[:, :, 1]] - 1
+            # neighbors > indices + 1 counts every contact once and skips the chain neighbours
+            is_contact = (neighbors > indices + 1) & self.hp & self.hp[np.maximum(neighbors, 0)]
+            contacts += is_contact.sum(axis=1)
+        return -contacts
+
+    def _contacts(self, chain_ids, residues, sites):
+        """Number of HH contacts of the given amino acids if they were placed on the given sites"""
+        contacts = np.zeros(len(chain_ids), dtype=np.int64)
+        for direction in DIRECTIONS:
+            neighbor_sites = sites + direction
+            neighbors = self.grids[chain_ids, neighbor_sites[:, 0], neighbor_sites[:, 1]] - 1
+            contacts += ((neighbors >= 0) & (np.abs(neighbors - residues) != 1) & self.hp[np.maximum(neighbors, 0)])
+        return contacts * self.hp[residues]
+
+    def _propose(self):
+        """Propose one move per conformation. A move displaces one or two amino acids (first and second),
+        returns the amino acids, their new sites, whether the second one moves and whether the move is legal"""
+        size, ids, positions = self.size, self._chain_ids, self.positions
+        residues = self.rng.integers(0, size, self.n_chains)
+        crankshaft = self.rng.random(self.n_chains) < self.crankshaft_rate
+
+        # End move, around the only neighbour of the amino acid
+        is_end = (residues == 0) | (residues == size - 1)
+        anchors = np.where(residues == 0, 1, size - 2)
+        end_sites = positions[ids, anchors] + DIRECTIONS[self.rng.integers(0, 4, self.n_chains)]
+
+        # Corner move, to the opposite corner of the square formed with the two neighbours
+        inner = np.clip(residues, 1, size - 2)
+        previous_sites, next_sites = positions[ids, inner - 1], positions[ids, inner + 1]
+        is_corner = ~is_end & np.all(np.abs(previous_sites - next_sites) == 1, axis=1)
+        corner_sites = previous_sites + next_sites - positions[ids, inner]
+
+        first = np.where(is_end, residues, inner)
+        first_sites = np.where(is_end[:, None], end_sites, corner_sites)
+        legal = is_end | is_corner
+
+        # Crankshaft move of the pair (first, first + 1), held by first - 1 and first + 2
+        pair = np.clip(residues - self.rng.integers(0, 2, self.n_chains), 1, size - 3)
+        anchor1, anchor2 = positions[ids, pair - 1], positions[ids, pair + 2]
+        offset = positions[ids, pair] - anchor1
+        is_crankshaft = ((np.abs(anchor1 - anchor2).sum(axis=1) == 1) &
+                         np.all(positions[ids, pair + 1] - anchor2 == offset, axis=1))
+        first = np.where(crankshaft, pair, first)
+        first_sites = np.where(crankshaft[:, None], anchor1 - offset, first_sites)
+        second_sites = anchor2 - offset
+        legal = np.where(crankshaft, is_crankshaft, legal)
+
+        legal &= self.grids[ids, first_sites[:, 0], first_sites[:, 1]] == 0
+        legal &= ~crankshaft | (self.grids[ids, second_sites[:, 0], second_sites[:, 1]] == 0)
+        return first, first_sites, first + 1, second_sites, crankshaft, legal
+
+    def _place(self, chain_ids, residues, old_sites, new_sites):
+        """Move amino acids in the occupancy grids and in the positions"""
+        self.grids[chain_ids, old_sites[:, 0], old_sites[:, 1]] = 0
+        self.grids[chain_ids, new_sites[:, 0], new_sites[:, 1]] = residues + 1
+        self.positions[chain_ids, residues] = new_sites
+
+    def step(self):
+        """Try one move on every conformation, returns the mask of the accepted moves"""
+        first, first_sites, second, second_sites, two_moved, legal = self._propose()
+        ids = self._chain_ids[legal]
+        first, first_sites = first[legal], first_sites[legal]
+        second, second_sites, two_moved = second[legal], second_sites[legal], two_moved[legal]
+        pairs = ids[two_moved]
+        old_first = self.positions[ids, first]
+        old_second = self.positions[pairs, second[two_moved]]
+
+        # The two amino acids of a crankshaft move are consecutive, so they never form a contact together
+        # and the energy change is the sum of their own changes
+        before = self._contacts(ids, first, old_first)
+        before[two_moved] += self._contacts(pairs, second[two_moved], old_second)
+        self._place(ids, first, old_first, first_sites)
+        self._place(pairs, second[two_moved], old_second, second_sites[two_moved])
+        after = self._contacts(ids, first, first_sites)
+        after[two_moved] += self._contacts(pairs, second[two_moved], second_sites[two_moved])
+
+        delta = before - after
+        temperatures = self.temperatures[ids]
+        with np.errstate(divide="ignore", over="ignore", invalid="ignore"):
+            metropolis = self.rng.random(len(ids)) < np.exp(-delta / (temperatures * K_B))
+        accepted = (delta <= 0) | ((temperatures > 0) & metropolis)
+
+        # Revert the rejected moves
+        rejected = ~accepted
+        rejected_pairs = rejected[two_moved]
+        self._place(pairs[rejected_pairs], second[two_moved][rejected_pairs], second_sites[two_moved][rejected_pairs],
+                    old_second[rejected_pairs])
+        self._place(ids[rejected], first[rejected], first_sites[rejected], old_first[rejected])
+        self.energies[ids[accepted]] += delta[accepted]
+
+        # Conformations drifting towards the border of their grid are moved back to the center
+        moved = ids[accepted]
+        sites = np.where(two_moved[:, None], second_sites, first_sites)[accepted]
+        near_border = np.any((first_sites[accepted] < self._margin) |
+                             (first_sites[accepted] >= self.grid_size - self._margin) |
+                             (sites < self._margin) | (sites >= self.grid_size - self._margin), axis=1)
+        if near_border.any():
+            self._recenter(moved[near_border])
+
+        improved = self.energies < self.best_energies
+        if improved.any():
+            self.best_energies[improved] = self.energies[improved]
+            self.best_positions[improved] = self.positions[improved]
+
+        accepted_mask = np.zeros(self.n_chains, dtype=bool)
+        accepted_mask[moved] = True
+        return accepted_mask
+
+    def run(self, n_steps):
+        """Try n_steps moves on every conformation, returns the number of accepted moves of each one"""
+        accepted = np.zeros(self.n_chains, dtype=np.int64)
+        for _ in range(n_steps):
+            accepted += self.step()
+        return accepted
+
+    def conformation(self, k, best=False):
+        """Get the coordinates of the conformation k (or of its best one) as (xcoords, ycoords) lists"""
+        positions = self.best_positions[k] if best else self.positions[k]
+        return positions[:, 0].tolist(), positions[:, 1].tolist()
+
+
+if __name__ == "__main__":
+    pa = argparse.ArgumentParser(description=("Program sampling many conformations of an HP protein at once"))
+    pa.usage = "batched.py fasta_input iterations --chains B --temp T --init random"
+    pa.add_argument("fasta_input", type=str, help="Name of the starting protein")
+    pa.add_argument("iterations", type=int, help="Number of tries to move an amino acid, per conformation")
+    pa.add_argument("--hp-table", type=str, default="default",
+                    help=("hydrophobicity table: default, kyte-doolittle, or residues: followed by the "
+                          "hydrophobic residues, e.g. residues:AILMFVW"))
+    pa.add_argument("--chains", type=int, default=1000, help=("number of conformations moved together"))
+    pa.add_argument("--temp", type=float, default=0,
+                    help=("temperature (K) of the Metropolis criterion, greedy descent by default"))
+    pa.add_argument("--init", type=str, default="linear", choices=["linear", "random"],
+                    help=("starting conformations, all linear or one random self-avoiding walk per conformation"))
+    pa.add_argument("--seed", type=int, default=None, help=("seed of the random generator"))
+    args = pa.parse_args()
+
+    try:
+        hp_sequence = fasta_read(args.fasta_input, args.hp_table)
+    except ValueError as error:
+        pa.error(str(error))
+    conformations = None
+    if args.init == "random":
+        conformations = list(random_walks(len(hp_sequence), args.chains, random.Random(args.seed)))
+    try:
+        batch = BatchedChains(hp_sequence, args.chains, args.temp, seed=args.seed, conformations=conformations)
+    except ValueError as error:
+        sys.exit(str(error))
+    accepted = batch.run(args.iterations)
+    print(f"\n{args.chains} conformations, {accepted.mean() / args.iterations:.1%} of the moves accepted")
+    print(f"Best energy is {batch.best_energies.min()}, mean best energy is {batch.best_energies.mean():.2f}\n")
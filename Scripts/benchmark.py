@@ -0,0 +1,182 @@
+from chain import Chain
+import argparse
+import json
+import platform
+import random
+import subprocess
+import time
+import timeit
+import tracemalloc
+
+DEFAULT_LENGTHS = [20, 100, 500, 2000]
+MOVE_GENERATORS = ["end_moves", "corner_moves", "crankshaft_moves", "pull_moves"]
+
+
+def synthetic_sequence(length, seed=0, h_fraction=0.5):
+    """Random HP sequence, the same for a given length and seed"""
+    rng = random.Random(f"{seed}-{length}")
+    return ''.join('H' if rng.random() < h_fraction else 'P' for _ in range(length))
+
+
+def prepared_chain(length, seed=0):
+    """Chain of a synthetic sequence, relaxed from the linear conformation by a short Metropolis run so that
+    the moves are timed on a realistic, partly compact, conformation"""
+    chain = Chain(synthetic_sequence(length, seed), seed=seed)
+    chain.initialize("linear")
+    chain.run(20 * length, temperature=300)
+    return chain
+
+
+def best_time(function, repeat, number):
+    """Best time of one call over repeat batches of number calls, in seconds"""
+    return min(timeit.repeat(function, repeat=repeat, number=number)) / number
+
+
+def bench_energy(chain, repeat=5):
+    """Time a full energy calculation"""
+    number = max(1, 20000 // len(chain))
+    per_call = best_time(chain.calculate_total_energy, repeat, number)
+    return {"seconds_per_call": per_call, "calls_per_second": 1 / per_call}
+
+
+def bench_moves(chain, repeat=5, number=20000):
+    """Time every move generator of ChainState on random amino acids (the ends for the end moves)"""
+    results = {}
+    rng = random.Random(0)
+    size = len(chain)
+    for generator_name in MOVE_GENERATORS:
+        generator = getattr(chain.state, generator_name)
+        if generator_name == "end_moves":
+            indices = [rng.choice((0, size - 1)) for _ in range(number)]
+        else:
+            indices = [rng.randrange(size) for _ in range(number)]
+        per_call = best_time(lambda: [generator(index) for index in indices], repeat, 1) / number
+        results[generator_name] = {"seconds_per_call": per_call, "calls_per_second": 1 / per_call}
+    return results
+
+
+def bench_folding(length, n_steps, temperature=None, seed=0, samples=20, move_table=False):
+    """Time a folding.py-equivalent run: initialization then n_steps moves, drawn from a MoveTable if
+    move_table. The energy is sampled against the wall clock during the run, and the peak memory is measured
+    by a second, traced, run"""
+    sequence = synthetic_sequence(length, seed)
+
+    start = time.perf_counter()
+    chain = Chain(sequence, seed=seed, move_table=move_table)
+    chain.initialize("linear")
+    initialized = time.perf_counter()
+    energy_trace = []
+    segment = max(1, n_steps // samples)
+    done = 0
+    accepted = 0
+    while done < n_steps:
+        accepted += chain.run(min(segment, n_steps - done), temperature)
+        done += min(segment, n_steps - done)
+        energy_trace.append({"seconds": time.perf_counter() - initialized, "steps": done,
+                             "energy": chain.total_energy, "best_energy": chain.best_energy})
+    finished = time.perf_counter()
+
+    tracemalloc.start()
+    traced_chain = Chain(sequence, seed=seed, move_table=move_table)
+    traced_chain.initialize("linear")
+    traced_chain.run(n_steps, temperature)
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        "steps": n_steps,
+        "init_seconds": initialized - start,
+        "run_seconds": finished - initialized,
+        "steps_per_second": n_steps / (finished - initialized),
+        "accepted_per_second": accepted / (finished - initialized),
+        "best_energy": chain.best_energy,
+        "peak_memory_bytes": peak_memory,
+        "energy_vs_time": energy_trace,
+    }
+
+
+def run_benchmarks(lengths, n_steps, temperature=None, seed=0, move_table=False):
+    """Run every benchmark for every chain length, also with a move table if move_table, returns a
+    JSON-serializable dict"""
+    results = {"metadata": metadata(lengths, n_steps, temperature, seed, move_table), "lengths": {}}
+    for length in lengths:
+        chain = prepared_chain(length, seed)
+        current = {
+            "energy": bench_energy(chain),
+            "moves": bench_moves(chain),
+            "folding": bench_folding(length, n_steps, temperature, seed),
+        }
+        if move_table:
+            current["folding_move_table"] = bench_folding(length, n_steps, temperature, seed, move_table=True)
+        results["lengths"][str(length)] = current
+        for name, label in (("folding", ""), ("folding_move_table", " with move table")):
+            if name in current:
+                print(f"{length:>6} residues{label} : {current[name]['steps_per_second']:,.0f} steps/s, "
+                      f"{current[name]['accepted_per_second']:,.0f} accepted moves/s, "
+                      f"best energy {current[name]['best_energy']}")
+    return results
+
+
+def metadata(lengths, n_steps, temperature, seed, move_table=False):
+    """Description of the benchmark run, to know what two result files compare"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "lengths": lengths,
+        "steps": n_steps,
+        "temperature": temperature,
+        "seed": seed,
+        "move_table": move_table,
+    }
+
+
+def compare(reference, results):
+    """Print the speed of every benchmark relative to a reference result file, > 1 is faster"""
+    for length, current in results["lengths"].items():
+        previous = reference["lengths"].get(length)
+        if previous is None:
+            continue
+        ratios = {"energy": current["energy"]["calls_per_second"] / previous["energy"]["calls_per_second"],
+                  "folding": current["folding"]["steps_per_second"] / previous["folding"]["steps_per_second"]}
+        if "folding_move_table" in current and "folding_move_table" in previous:
+            ratios["folding_move_table"] = (current["folding_move_table"]["steps_per_second"] /
+                                            previous["folding_move_table"]["steps_per_second"])
+        for generator_name in MOVE_GENERATORS:
+            if generator_name in previous["moves"]:
+                ratios[generator_name] = (current["moves"][generator_name]["calls_per_second"] /
+                                          previous["moves"][generator_name]["calls_per_second"])
+        print(f"{length:>6} residues : " + ", ".join(f"{name} x{ratio:.2f}" for name, ratio in ratios.items()))
+
+
+if __name__ == "__main__":
+    pa = argparse.ArgumentParser(description=("Benchmark of the energy, the moves and the folding throughput"))
+    pa.usage = "benchmark.py --lengths 20 100 500 2000 --steps 20000 -o Results/benchmark.json"
+    pa.add_argument("--lengths", nargs="+", type=int, default=DEFAULT_LENGTHS,
+                    help=("lengths of the synthetic HP sequences"))
+    pa.add_argument("--steps", type=int, default=20000, help=("number of moves of the folding runs"))
+    pa.add_argument("--temp", type=float, default=None,
+                    help=("temperature (K) of the folding runs, greedy descent by default"))
+    pa.add_argument("--seed", type=int, default=0, help=("seed of the sequences and of the runs"))
+    pa.add_argument("--move-table", action="store_true",
+                    help=("also time the folding runs drawing every move from a move table"))
+    pa.add_argument("-o", "--output", type=str, default="./Results/benchmark.json",
+                    help=("JSON file receiving the results"))
+    pa.add_argument("--compare", type=str, default=None,
+                    help=("previous result file to compare the speeds with"))
+    args = pa.parse_args()
+
+    results = run_benchmarks(args.lengths, args.steps, args.temp, args.seed, args.move_table)
+    with open(args.output, "w") as filout:
+        json.dump(results, filout, indent=2)
+    print(f"\nResults written to {args.output}\n")
+
+    if args.compare:
+        with open(args.compare, "r") as filin:
+            compare(json.load(filin), results)
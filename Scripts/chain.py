@@ -0,0 +1,360 @@
+import math
+import random
+from time import perf_counter
+from AminoAcidClass import AminoAcid
+from chain_state import ChainState
+from move_table import MoveTable
+from saw import random_walk
+import rendering
+
+K_B = 0.0019872041  # Boltzmann constant in kcal/(mol.K), temperatures are given in K
+MOVE_TYPES = ("end", "corner", "crankshaft", "pull")
+
+
+class Chain(object):
+    """
+        A protein folded on the 2D lattice. A Chain owns its amino acids, their coordinates and its random
+        generator, so several chains can be folded side by side in the same process.
+
+        Attributes:
+        - state: ChainState holding the coordinates and the occupancy index.
+        - residues: List of the AminoAcid views, in chain order.
+        - rng: Random generator used for the initialization and the moves.
+        - total_energy: Running total energy, updated incrementally by movement().
+        - best_energy, best_conformation: Lowest energy conformation seen, kept as the difference with the
+          current conformation.
+        - check_interval: If > 0, compare total_energy with a full recomputation every check_interval moves.
+        - pull_moves: If True, pull moves are added to the end, corner and crankshaft moves.
+        - stats: Optional MoveStatistics counting and timing the moves, None disables the instrumentation.
+        - move_table: Optional MoveTable of the legal moves, used by step() to draw a legal move uniformly.
+
+        Methods:
+        - initialize(mode="linear"): Initialize the positions of amino acids, either randomly or linearly.
+        - movement(index, temperature): Move an amino acid and accept or reject the new position.
+        - step(temperature): Try one Monte Carlo move, on a random amino acid or drawn from the move table.
+        - run(n_steps, temperature, target_energy): Try n_steps moves with step(), keeping the best conformation.
+        - set_conformation(xcoords, ycoords): Place the amino acids at the given coordinates.
+        - set_best(best_energy, best_conformation): Replace the lowest energy conformation seen.
+        - get_state(), set_state(state): Save and restore the whole simulation state, for checkpoints.
+        - calculate_total_energy(): Calculate the total energy of the system based on the HP model.
+        - check_energy(): Compare the running total energy with a full recomputation.
+        - visualize_molecule(name, best): Visualize the current or the lowest energy conformation.
+        - used_coordinates(): Get a list of coordinates that are currently occupied by amino acids.
+        - is_occupied(coords): Check if a lattice site is occupied by an amino acid.
+
+        """
+
+    def __init__(self, hp_sequence, seed=None, check_interval=0, pull_moves=True, stats=None, move_table=False):
+        """Create the amino acids of an HP sequence, placed linearly. With move_table, the legal moves of every
+        amino acid are kept in a MoveTable updated after each move"""
+        self.state = ChainState(hp_sequence)
+        self.residues = [AminoAcid(i + 1, char, self) for i, char in enumerate(hp_sequence)]
+        self.rng = random.Random(seed)
+        self.check_interval = check_interval
+        self.pull_moves = pull_moves
+        self.stats = stats
+        self.total_energy = 0
+        self._moves_done = 0
+        self.move_table = MoveTable(self.state, pull_moves) if move_table else None
+        self._save_best()
+
+    def __iter__(self):
+        return iter(self.residues)
+
+    def __len__(self):
+        return len(self.residues)
+
+    def initialize(self, mode="linear"):
+        """
+                Initialize the positions of amino acids.
+
+                Args:
+                - mode (str): The initialization mode, either 'random' or 'linear'.
+
+                """
+        if mode == "random":
+            # Pivot algorithm from the straight chain, always self-avoiding, see saw.py
+            xcoords, ycoords = random_walk(len(self.residues), self.rng)
+            self.state.set_conformation(xcoords, ycoords)
+        else:
+            if mode != "linear":
+                print("Invalid mode format, should be 'random' or 'linear', proceeding with 'linear'")
+
+            for aa_object in self:
+                aa_object.set_coordinates(aa_object.index, 0)
+
+        self.state.rebuild_occupancy()
+        self.total_energy = self.calculate_total_energy()
+        self._moves_done = 0
+        self._rebuild_move_table()
+        self._save_best()
+
+    def movement(self, index, temperature=None):
+        """Simulate movement of the amino acid at index and accept or reject the new position.
+        A move is drawn uniformly among the legal moves of the amino acid. Without temperature only the moves
+        that do not increase the energy are accepted, otherwise the Metropolis-Hastings criterion is used: the
+        number of legal moves differs between the amino acids and the conformations, the ratio of the
+        probabilities to propose the reverse move and the move keeps the sampling at the Boltzmann
+        distribution. Only the contacts of the moved amino acids are scored, the total energy is updated from
+        the difference"""
+        if self.stats is not None:
+            return self._instrumented_movement(index, temperature)
+
+        possible_moves = self._possible_moves(index)
+        if not possible_moves:
+            return False
+        selected_move_type, selected_move = self._select_move(possible_moves)
+        changes = self.state.move_changes((selected_move_type, selected_move))
+        # Greedy descent ignores the proposal probabilities, they are only computed with a temperature
+        forward = self._proposal_probability(changes, index, possible_moves) if temperature else None
+        new_total_energy, prev_coords = self._try_move(changes)
+        proposal_ratio = self._proposal_probability(prev_coords) / forward if temperature else 1.0
+        return self._accept_or_revert(new_total_energy, prev_coords, temperature, proposal_ratio)
+
+    def _instrumented_movement(self, index, temperature):
+        """Same as movement(), counting the moves and timing every phase in self.stats"""
+        stats = self.stats
+        start = perf_counter()
+        possible_moves = self._possible_moves(index)
+        enumerated = perf_counter()
+        stats.add_time("enumeration", enumerated - start)
+        stats.count_possible(self.move_types(), possible_moves)
+        if not possible_moves:
+            return False
+
+        selected_move_type, selected_move = self._select_move(possible_moves)
+        changes = self.state.move_changes((selected_move_type, selected_move))
+        forward = self._proposal_probability(changes, index, possible_moves) if temperature else None
+        new_total_energy, prev_coords = self._try_move(changes)
+        proposal_ratio = self._proposal_probability(prev_coords) / forward if temperature else 1.0
+        scored = perf_counter()
+        accepted = self._accept_or_revert(new_total_energy, prev_coords, temperature, proposal_ratio)
+        stats.add_time("energy", scored - enumerated)
+        stats.add_time("bookkeeping", perf_counter() - scored)
+        stats.count_result(selected_move_type, accepted)
+        return accepted
+
+    def step(self, temperature=None):
+        """Try one Monte Carlo move. Without move table, a random amino acid is moved by movement(), otherwise
+        a move is drawn uniformly among all the legal moves of the chain"""
+        if self.move_table is None:
+            return self.movement(self.rng.randrange(len(self.residues)), temperature)
+
+        table = self.move_table
+        stats = self.stats
+        if stats is not None:
+            start = perf_counter()
+        moves_before = table.total
+        move = table.sample(self.rng)
+        if move is None:
+            return False
+        changes = table.changes(move)
+        # Greedy descent ignores the proposal probabilities, the listings are only counted with a temperature
+        listings = table.count(changes) if temperature else None
+        if stats is not None:
+            enumerated = perf_counter()
+            stats.add_time("enumeration", enumerated - start)
+            stats.count_possible((move[0],), (move,))
+
+        new_total_energy, prev_coords = self._try_move(changes)
+        if stats is not None:
+            scored = perf_counter()
+            stats.add_time("energy", scored - enumerated)
+        # The move is accepted in two stages, with probability min(1, exp(-dE / kT)) * min(1, proposal ratio),
+        # which also satisfies detailed balance. The table is only refreshed for the moves passing the energy
+        # criterion, most of the moves are rejected by it
+        accepted = self._accepts(new_total_energy, temperature)
+        if accepted:
+            undo = table.update(changes, prev_coords)
+            if temperature:
+                # A move is proposed with probability listings / total moves. The reverse move may not be listed
+                # at all after the move (a pull move of a chain end dragging several amino acids), it is then
+                # rejected, otherwise the ratio of the probabilities to propose the reverse move and the move
+                # corrects the acceptance (Metropolis-Hastings)
+                reverse_listings = table.count(prev_coords)
+                proposal_ratio = reverse_listings * moves_before / (listings * table.total)
+                accepted = self._accepts(self.total_energy, temperature, proposal_ratio)
+            if not accepted:
+                table.restore(undo)
+        self._keep_or_revert(accepted, new_total_energy, prev_coords)
+        if stats is not None:
+            stats.add_time("bookkeeping", perf_counter() - scored)
+            stats.count_result(move[0], accepted)
+        return accepted
+
+    def move_types(self):
+        """Names of the move types used by movement()"""
+        return MOVE_TYPES if self.pull_moves else MOVE_TYPES[:-1]
+
+    def _possible_moves(self, index):
+        """List the legal moves of the amino acid at index, as (move type, changes or pull descriptor) tuples"""
+        return self.state.residue_moves(index, self.pull_moves)
+
+    def _select_move(self, possible_moves):
+        """Choose a move uniformly among the legal moves of an amino acid"""
+        if len(possible_moves) == 1:
+            return possible_moves[0]
+        return self.rng.choice(possible_moves)
+
+    def _proposal_probability(self, changes, index=None, possible_moves=None):
+        """Probability, up to the factor 1 / N of the choice of the amino acid, that movement() proposes a move
+        with these changes in the current conformation. Only the amino acids at both ends of the moved segment
+        list such a move, possible_moves are the already listed moves of the amino acid at index"""
+        probability = 0.0
+        for end in {min(changes), max(changes)}:
+            moves = possible_moves if end == index else self._possible_moves(end)
+            if moves:
+                probability += self.state.count_moves(moves, changes) / len(moves)
+        return probability
+
+    def _try_move(self, move):
+        """Apply a move, returns the new total energy and the coordinates reverting the move"""
+        state = self.state
+        prev_local_energy = state.local_energy(move)
+        prev_coords = state.apply(move)
+
+        # Calculate the new total energy from the contacts gained or lost by the moved amino acids
+        return self.total_energy + state.local_energy(move) - prev_local_energy, prev_coords
+
+    def _accept_or_revert(self, new_total_energy, prev_coords, temperature, proposal_ratio=1.0):
+        """Accept the applied move or revert it. proposal_ratio is the ratio of the probabilities to propose
+        the reverse move and the move, 1 for symmetric proposals"""
+        accepted = self._accepts(new_total_energy, temperature, proposal_ratio)
+        self._keep_or_revert(accepted, new_total_energy, prev_coords)
+        return accepted
+
+    def _accepts(self, new_total_energy, temperature, proposal_ratio=1.0):
+        """Decide whether a move to new_total_energy is accepted"""
+        prev_total_energy = self.total_energy
+        if not temperature:
+            # Greedy descent, only keep the moves that do not increase the energy
+            return new_total_energy <= prev_total_energy
+        # Metropolis criterion min(1, proposal_ratio * exp(-dE / kT)), in log space as the exponential of
+        # an energy decrease overflows at low temperature
+        if proposal_ratio <= 0:
+            return False
+        exponent = math.log(proposal_ratio) - (new_total_energy - prev_total_energy) / (temperature * K_B)
+        return exponent >= 0 or self.rng.random() < math.exp(exponent)
+
+    def _keep_or_revert(self, accepted, new_total_energy, prev_coords):
+        """Keep an accepted move, revert a rejected one"""
+        if not accepted:
+            self.state.apply(prev_coords)
+            self._update_energy(self.total_energy)
+            return
+        self._update_energy(new_total_energy)
+        self._track_best(prev_coords)
+
+    def run(self, n_steps, temperature=None, target_energy=None):
+        """Try n_steps moves with step(), keeping the lowest energy conformation seen. The run stops early
+        once target_energy is reached. Returns the number of accepted moves"""
+        accepted = 0
+        for _ in range(n_steps):
+            if self.step(temperature):
+                accepted += 1
+                if target_energy is not None and self.best_energy <= target_energy:
+                    break
+        return accepted
+
+    def set_conformation(self, xcoords, ycoords):
+        """Place the amino acids at the given coordinates and recompute the energy"""
+        self.state.set_conformation(xcoords, ycoords)
+        self.total_energy = self.calculate_total_energy()
+        self._rebuild_move_table()
+        self._save_best()
+
+    def get_state(self):
+        """Get everything needed to continue the simulation identically, as a picklable dict"""
+        xcoords, ycoords = self.state.conformation()
+        return {
+            "hp_sequence": self.state.hp_sequence,
+            "xcoords": xcoords,
+            "ycoords": ycoords,
+            "total_energy": self.total_energy,
+            "best_energy": self.best_energy,
+            "best_conformation": self.best_conformation,
+            "rng_state": self.rng.getstate(),
+            "moves_done": self._moves_done,
+            "pull_moves": self.pull_moves,
+        }
+
+    def set_state(self, state):
+        """Restore a state returned by get_state(), on a chain with the same sequence"""
+        if state["hp_sequence"] != self.state.hp_sequence:
+            raise ValueError("The saved state belongs to another sequence")
+        self.state.set_conformation(state["xcoords"], state["ycoords"])
+        self.total_energy = state["total_energy"]
+        self.set_best(state["best_energy"], state["best_conformation"])
+        self.rng.setstate(state["rng_state"])
+        self._moves_done = state["moves_done"]
+        self.pull_moves = state["pull_moves"]
+        self._rebuild_move_table()
+
+    def _rebuild_move_table(self):
+        """List the legal moves again after the whole conformation changed"""
+        if self.move_table is not None:
+            self.move_table = MoveTable(self.state, self.pull_moves)
+
+    @property
+    def best_conformation(self):
+        """Lowest energy conformation seen, as (xcoords, ycoords) lists"""
+        xcoords, ycoords = self.state.conformation()
+        for index, (x, y) in self._best_diff.items():
+            xcoords[index], ycoords[index] = x, y
+        return xcoords, ycoords
+
+    def set_best(self, best_energy, best_conformation):
+        """Replace the lowest energy conformation seen, e.g. when restoring a saved state"""
+        self.best_energy = best_energy
+        self._best_diff = {i: (x, y) for i, (x, y) in enumerate(zip(*best_conformation))
+                           if (x, y) != self.state.get_position(i)}
+
+    def _save_best(self):
+        """Make the current conformation the lowest energy one"""
+        self.best_energy = self.total_energy
+        # The best conformation is stored as the positions it had for the amino acids moved since
+        self._best_diff = {}
+
+    def _track_best(self, prev_coords):
+        """Update the lowest energy conformation after an accepted move, prev_coords are the positions the
+        moved amino acids had before it. Costs O(number of moved amino acids), a new minimum only clears the
+        difference with the current conformation"""
+        if self.total_energy < self.best_energy:
+            self._save_best()
+            return
+        best_diff = self._best_diff
+        for index, coords in prev_coords.items():
+            if index not in best_diff:
+                best_diff[index] = coords
+
+    def _update_energy(self, energy):
+        """Store the running total energy and check it against a full recomputation if asked to"""
+        self.total_energy = energy
+        self._moves_done += 1
+        if self.check_interval > 0 and self._moves_done % self.check_interval == 0:
+            self.check_energy()
+
+    def check_energy(self):
+        """Compare the running total energy with a full recomputation, raise a RuntimeError if they differ"""
+        full_energy = self.calculate_total_energy()
+        if full_energy != self.total_energy:
+            raise RuntimeError(f"Running energy {self.total_energy} differs from the recomputed energy "
+                               f"{full_energy} after {self._moves_done} moves")
+
+    def calculate_total_energy(self):
+        """Calculate the total energy of the system based on the HP model."""
+        return self.state.total_energy()
+
+    def visualize_molecule(self, name, best=False):
+        """Visualize the entire molecular structure, or the lowest energy one seen if best, saved as
+        Results/name.png."""
+        xcoords, ycoords = self.best_conformation if best else (self.state.xcoords, self.state.ycoords)
+        rendering.draw_molecule(self.state.hp_sequence, xcoords, ycoords, name)
+
+    def used_coordinates(self):
+        """Get a list of coordinates that are currently occupied by amino acids."""
+        return list(zip(self.state.xcoords, self.state.ycoords))
+
+    def is_occupied(self, coords):
+        """Check if a lattice site is occupied by an amino acid"""
+        return coords in self.state.occupancy
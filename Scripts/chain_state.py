@@ -0,0 +1,319 @@
+from array import array
+
+# Relative coordinates of the 4 lattice sites next to a site
+NEIGHBORS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+
+
+class ChainState(object):
+    """
+        Compact state of a chain on the 2D lattice, stored as contiguous integer arrays.
+
+        The sequence (H/P flags) is never modified by the moves, only the coordinates and the occupancy index
+        change with the conformation.
+
+        Attributes:
+        - hp_flags: 1 for an hydrophobic (H) amino acid, 0 for a polar (P) one, per residue.
+        - xcoords: X-coordinates of the amino acids (array of ints).
+        - ycoords: Y-coordinates of the amino acids (array of ints).
+        - occupancy: Lattice site (x, y) -> index of the amino acid placed on it.
+
+        Methods:
+        - set_position(index, x, y): Move an amino acid and update the occupancy index.
+        - apply(changes): Move several amino acids at once, returns the changes reverting the move.
+        - total_energy(): Calculate the energy of the conformation based on the HP model.
+        - local_energy(indices): Calculate the energy of the contacts involving the given amino acids.
+        - end_moves(index), corner_moves(index), crankshaft_moves(index), pull_moves(index): List the legal
+          moves of an amino acid.
+        - residue_moves(index, pull_moves): List all the legal moves of an amino acid.
+        - count_moves(moves, changes): Count the listed moves with the given changes.
+        - conformation(): Get a compact copy of the coordinates.
+
+        """
+    __slots__ = ("hp_flags", "xcoords", "ycoords", "occupancy")
+
+    def __init__(self, hp_sequence=""):
+        """Initialize a linear chain from an HP sequence"""
+        self.hp_flags = bytearray(1 if char == 'H' else 0 for char in hp_sequence)
+        self.xcoords = array('i', range(len(hp_sequence)))
+        self.ycoords = array('i', [0]) * len(hp_sequence)
+        self.rebuild_occupancy()
+
+    def __len__(self):
+        return len(self.hp_flags)
+
+    @property
+    def hp_sequence(self):
+        """HP sequence of the chain as a string"""
+        return ''.join('H' if flag else 'P' for flag in self.hp_flags)
+
+    def get_position(self, index):
+        """Get the coordinates of an amino acid"""
+        return self.xcoords[index], self.ycoords[index]
+
+    def set_position(self, index, x, y):
+        """Move an amino acid and update the occupancy index"""
+        old_coords = (self.xcoords[index], self.ycoords[index])
+        # The site may already have been taken by another amino acid during a multi-residue move
+        if self.occupancy.get(old_coords) == index:
+            del self.occupancy[old_coords]
+        self.xcoords[index] = x
+        self.ycoords[index] = y
+        self.occupancy[(x, y)] = index
+
+    def set_conformation(self, xcoords, ycoords):
+        """Replace all the coordinates at once"""
+        self.xcoords = array('i', xcoords)
+        self.ycoords = array('i', ycoords)
+        self.rebuild_occupancy()
+
+    def rebuild_occupancy(self):
+        """Rebuild the occupancy index from the coordinate arrays"""
+        self.occupancy = {(x, y): index for index, (x, y) in enumerate(zip(self.xcoords, self.ycoords))}
+
+    def apply(self, changes):
+        """
+            Move several amino acids at once.
+
+            Args:
+            - changes (dict): Index of the amino acid -> new (x, y) coordinates.
+
+            Returns:
+            - dict: The changes to apply to revert the move.
+
+            """
+        previous = {index: (self.xcoords[index], self.ycoords[index]) for index in changes}
+        for index, (x, y) in changes.items():
+            self.set_position(index, x, y)
+        return previous
+
+    def conformation(self):
+        """Get a compact copy of the coordinates"""
+        return array('i', self.xcoords), array('i', self.ycoords)
+
+    def is_self_avoiding(self):
+        """Check that the chain is connected and that no two amino acids share a site"""
+        xs, ys = self.xcoords, self.ycoords
+        for i in range(len(xs) - 1):
+            if abs(xs[i] - xs[i + 1]) + abs(ys[i] - ys[i + 1]) != 1:
+                return False
+        return len(set(zip(xs, ys))) == len(xs)
+
+    # Energy
+    def total_energy(self):
+        """Calculate the energy of the conformation based on the HP model, -1 per HH contact
+        between amino acids that are not consecutive in the chain"""
+        energy = 0
+        hp_flags, occupancy = self.hp_flags, self.occupancy
+        xs, ys = self.xcoords, self.ycoords
+        for i, flag in enumerate(hp_flags):
+            if flag:
+                x, y = xs[i], ys[i]
+                for dx, dy in NEIGHBORS:
+                    j = occupancy.get((x + dx, y + dy))
+                    # j > i + 1 counts every contact once and skips the chain neighbours
+                    if j is not None and j > i + 1 and hp_flags[j]:
+                        energy -= 1
+        return energy
+
+    def local_energy(self, indices):
+        """Calculate the energy of the HH contacts involving at least one of the given amino acids.
+        The difference of this value before and after a move is the energy change of the move"""
+        energy = 0
+        hp_flags, occupancy = self.hp_flags, self.occupancy
+        xs, ys = self.xcoords, self.ycoords
+        for i in indices:
+            if hp_flags[i]:
+                x, y = xs[i], ys[i]
+                for dx, dy in NEIGHBORS:
+                    j = occupancy.get((x + dx, y + dy))
+                    if j is None or not hp_flags[j] or abs(i - j) == 1:
+                        continue
+                    # A contact between two of the given amino acids is counted from its lowest index
+                    if j in indices and j < i:
+                        continue
+                    energy -= 1
+        return energy
+
+    # Moveset, each move is a dict: index of the amino acid -> new (x, y) coordinates
+    def end_moves(self, index):
+        """List the moves of an amino acid at one end of the chain around its only neighbour"""
+        size = len(self.hp_flags)
+        if size < 2:
+            return []
+        if index == 0:
+            anchor = 1
+        elif index == size - 1:
+            anchor = size - 2
+        else:
+            return []
+
+        x, y = self.xcoords[anchor], self.ycoords[anchor]
+        return [{index: (x + dx, y + dy)} for dx, dy in NEIGHBORS if (x + dx, y + dy) not in self.occupancy]
+
+    def corner_moves(self, index):
+        """List the moves flipping an amino acid to the opposite corner of the square it forms
+        with its two neighbours"""
+        if index == 0 or index >= len(self.hp_flags) - 1:
+            return []
+        xs, ys = self.xcoords, self.ycoords
+        if abs(xs[index - 1] - xs[index + 1]) != 1 or abs(ys[index - 1] - ys[index + 1]) != 1:
+            return []
+
+        new_coords = (xs[index - 1] + xs[index + 1] - xs[index], ys[index - 1] + ys[index + 1] - ys[index])
+        if new_coords in self.occupancy:
+            return []
+        return [{index: new_coords}]
+
+    def crankshaft_moves(self, index):
+        """List the moves rotating the U shape formed by the amino acid and one of its neighbours
+        around the axis of the two amino acids holding it"""
+        moves = []
+        for first in (index, index - 1):
+            move = self._crankshaft(first)
+            if move:
+                moves.append(move)
+        return moves
+
+    def _crankshaft(self, first):
+        """Crankshaft move of the pair (first, first + 1), held by first - 1 and first + 2"""
+        if first < 1 or first + 2 >= len(self.hp_flags):
+            return None
+        xs, ys = self.xcoords, self.ycoords
+        anchor1 = (xs[first - 1], ys[first - 1])
+        anchor2 = (xs[first + 2], ys[first + 2])
+        if abs(anchor1[0] - anchor2[0]) + abs(anchor1[1] - anchor2[1]) != 1:
+            return None
+
+        dx, dy = xs[first] - anchor1[0], ys[first] - anchor1[1]
+        if (xs[first + 1] - anchor2[0], ys[first + 1] - anchor2[1]) != (dx, dy):
+            return None
+
+        new_first = (anchor1[0] - dx, anchor1[1] - dy)
+        new_second = (anchor2[0] - dx, anchor2[1] - dy)
+        if new_first in self.occupancy or new_second in self.occupancy:
+            return None
+        return {first: new_first, first + 1: new_second}
+
+    def pull_moves(self, index):
+        """List the pull moves of an amino acid (Lesh et al. 2003) in both directions of the chain.
+        The amino acid is moved to a free site L next to its neighbour, the following amino acids are pulled
+        into the sites freed by the chain until it is connected again"""
+        return [self.pull_changes(pull) for pull in self.pull_descriptors(index)]
+
+    def pull_descriptors(self, index, single=True):
+        """
+            List the pull moves of an amino acid in both directions without building their changes. Whether a
+            pull move is legal only depends on the sites around the amino acid, while its changes depend on the
+            positions of the whole pulled segment.
+
+            Args:
+            - index (int): Index of the amino acid.
+            - single (bool): If False, leave out the pull moves only displacing the amino acid itself, they are
+              the same as an end or corner move.
+
+            Returns:
+            - list: (index, step, site L, site C) tuples, see pull_changes(). C is None if only the amino acid moves.
+
+            """
+        return self._pull_descriptors(index, -1, single) + self._pull_descriptors(index, 1, single)
+
+    def pull_changes(self, pull):
+        """Build the changes of a pull move described by pull_descriptors()"""
+        index, step, site_l, site_c = pull
+        if site_c is None:
+            return {index: site_l}
+        return self._pull_chain({index: site_l, index + step: site_c}, index + 2 * step, step)
+
+    def residue_moves(self, index, pull_moves=True):
+        """List the legal moves of an amino acid as (move type, changes or pull descriptor) tuples, see
+        move_changes(). The pull moves only displacing the amino acid are left out, they are end or corner moves"""
+        moves = [("end", move) for move in self.end_moves(index)]
+        moves += [("corner", move) for move in self.corner_moves(index)]
+        moves += [("crankshaft", move) for move in self.crankshaft_moves(index)]
+        if pull_moves:
+            moves += [("pull", pull) for pull in self.pull_descriptors(index, single=False)]
+        return moves
+
+    def move_changes(self, move):
+        """Get the changes (index -> new coordinates) of a move listed by residue_moves()"""
+        move_type, move_data = move
+        if move_type == "pull":
+            return self.pull_changes(move_data)
+        return move_data
+
+    def count_moves(self, moves, changes):
+        """
+            Count the moves of a list given by residue_moves() having the given changes. The same displacement
+            can be listed several times, e.g. a crankshaft move by both amino acids of its pair, which the
+            probability to propose it has to account for.
+
+            Args:
+            - moves (list): (move type, changes or pull descriptor) tuples.
+            - changes (dict): index -> new coordinates.
+
+            Returns:
+            - int: Number of moves of the list with these changes.
+
+            """
+        count = 0
+        for move_type, move_data in moves:
+            if move_type == "pull":
+                index, step, site_l, site_c = move_data
+                # Only build the changes of the pull moves starting like the wanted ones
+                if changes.get(index) != site_l or changes.get(index + step) != site_c:
+                    continue
+                move_data = self.pull_changes(move_data)
+            if move_data == changes:
+                count += 1
+        return count
+
+    def _pull_descriptors(self, index, step, single):
+        """Pull moves of the amino acid at index dragging the amino acids index + step, index + 2 * step, ...
+        The amino acid index - step holds the moved one, at the end of the chain two free sites are used instead"""
+        size = len(self.hp_flags)
+        xs, ys, occupancy = self.xcoords, self.ycoords, self.occupancy
+        x, y = xs[index], ys[index]
+        anchor = index - step
+        follower = index + step
+        pulls = []
+
+        if 0 <= anchor < size:
+            ax, ay = xs[anchor], ys[anchor]
+            for dx, dy in NEIGHBORS:
+                site_l = (ax + dx, ay + dy)
+                # L must be a free site next to the anchor and diagonal to the amino acid
+                if abs(site_l[0] - x) != 1 or abs(site_l[1] - y) != 1 or site_l in occupancy:
+                    continue
+                # C completes the square formed by the amino acid, the anchor and L
+                site_c = (x + dx, y + dy)
+                if not 0 <= follower < size or (xs[follower], ys[follower]) == site_c:
+                    # End of the chain, or the chain is already connected: this is an end or a corner move
+                    if single:
+                        pulls.append((index, step, site_l, None))
+                elif site_c not in occupancy:
+                    pulls.append((index, step, site_l, site_c))
+        elif 0 <= follower < size:
+            # The amino acid is an end of the chain, it moves two sites away and pulls the whole chain
+            for dx, dy in NEIGHBORS:
+                site_c = (x + dx, y + dy)
+                if site_c in occupancy:
+                    continue
+                for ldx, ldy in NEIGHBORS:
+                    site_l = (site_c[0] + ldx, site_c[1] + ldy)
+                    if site_l not in occupancy:
+                        pulls.append((index, step, site_l, site_c))
+        return pulls
+
+    def _pull_chain(self, changes, start, step):
+        """Pull the amino acids from start onwards into the site left two positions ahead of them, until
+        one of them is already next to the new position of the previous one"""
+        size = len(self.hp_flags)
+        xs, ys = self.xcoords, self.ycoords
+        j = start
+        while 0 <= j < size:
+            prev_x, prev_y = changes[j - step]
+            if abs(xs[j] - prev_x) + abs(ys[j] - prev_y) == 1:
+                break
+            changes[j] = (xs[j - 2 * step], ys[j - 2 * step])
+            j += step
+        return changes
@@ -0,0 +1,40 @@
+import os
+import pickle
+
+CHECKPOINT_VERSION = 1
+
+
+def save_checkpoint(name, state):
+    """
+    Write a simulation state to a binary checkpoint file. The file is written next to its final name then
+    renamed, so a run killed while writing always leaves the previous checkpoint intact.
+
+    Args:
+    - name (str): The name of the checkpoint file.
+    - state (dict): The state to save, made of picklable values (arrays, numbers, random generator states).
+
+    """
+    temporary_name = name + ".tmp"
+    with open(temporary_name, "wb") as filout:
+        pickle.dump({"version": CHECKPOINT_VERSION, "state": state}, filout, protocol=pickle.HIGHEST_PROTOCOL)
+        filout.flush()
+        os.fsync(filout.fileno())
+    os.replace(temporary_name, name)
+
+
+def load_checkpoint(name):
+    """
+    Read a simulation state written by save_checkpoint().
+
+    Args:
+    - name (str): The name of the checkpoint file.
+
+    Returns:
+    - dict: The saved state.
+
+    """
+    with open(name, "rb") as filin:
+        checkpoint = pickle.load(filin)
+    if checkpoint.get("version") != CHECKPOINT_VERSION:
+        raise ValueError(f"Unsupported checkpoint version {checkpoint.get('version')} in {name}")
+    return checkpoint["state"]
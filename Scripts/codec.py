@@ -0,0 +1,161 @@
+from collections import OrderedDict
+
+# Lattice directions in counterclockwise order, a left turn adds 1 to the direction and a right turn removes 1
+DIRECTIONS = ((1, 0), (0, 1), (-1, 0), (0, -1))
+DIRECTION_INDEX = {direction: i for i, direction in enumerate(DIRECTIONS)}
+# Relative directions, 2 bits per bond
+STRAIGHT, LEFT, RIGHT = 0, 1, 2
+
+
+def encode(xcoords, ycoords):
+    """
+        Encode a conformation as the relative directions of its bonds, 2 bits per bond, packed in an int.
+
+        The first bond only sets the orientation and is not stored, so all the rotations of a conformation have
+        the same code. The reflections are folded together by mirroring the conformations whose first turn
+        is a right turn, so the code is canonical under the lattice rotations and reflections.
+
+        Args:
+        - xcoords, ycoords (sequence of int): Coordinates of the amino acids.
+
+        Returns:
+        - int: The turn between the bonds k and k + 1 is stored in the bits 2k and 2k + 1.
+
+        """
+    size = len(xcoords)
+    code = 0
+    if size < 3:
+        return code
+    previous = _direction(xcoords, ycoords, 1)
+    mirror = None
+    for k in range(2, size):
+        direction = _direction(xcoords, ycoords, k)
+        turn = (direction - previous) % 4
+        if turn == 2:
+            raise ValueError(f"Amino acid {k + 1} goes back onto amino acid {k - 1}")
+        if turn:
+            turn = LEFT if turn == 1 else RIGHT
+            if mirror is None:
+                mirror = turn == RIGHT
+            if mirror:
+                turn = LEFT + RIGHT - turn
+            code |= turn << 2 * (k - 2)
+        previous = direction
+    return code
+
+
+def _direction(xcoords, ycoords, k):
+    """Index of the direction of the bond between the amino acids k - 1 and k"""
+    try:
+        return DIRECTION_INDEX[(xcoords[k] - xcoords[k - 1], ycoords[k] - ycoords[k - 1])]
+    except KeyError:
+        raise ValueError(f"Amino acids {k} and {k + 1} are not neighbours on the lattice") from None
+
+
+def decode(code, size):
+    """Coordinates (xcoords, ycoords) of a conformation of size amino acids encoded by encode(), starting
+    at (0, 0) with a first bond along x and a first turn to the left"""
+    xcoords, ycoords = [0], [0]
+    direction = 0
+    for k in range(1, size):
+        if k >= 2:
+            turn = (code >> 2 * (k - 2)) & 3
+            if turn == LEFT:
+                direction = (direction + 1) % 4
+            elif turn == RIGHT:
+                direction = (direction - 1) % 4
+        dx, dy = DIRECTIONS[direction]
+        xcoords.append(xcoords[-1] + dx)
+        ycoords.append(ycoords[-1] + dy)
+    return xcoords, ycoords
+
+
+def code_length(size):
+    """Number of bytes of the code of a conformation of size amino acids"""
+    return (2 * max(0, size - 2) + 7) // 8
+
+
+def to_bytes(code, size):
+    """Fixed-size bytes of a code, to store many conformations of the same sequence"""
+    return code.to_bytes(code_length(size), "little")
+
+
+def from_bytes(data):
+    """Code stored by to_bytes()"""
+    return int.from_bytes(data, "little")
+
+
+def write_folds(name, folds, size):
+    """Write (energy, code) pairs as text lines: energy, then the bytes of the code in hexadecimal"""
+    with open(name, "w") as filout:
+        for energy, code in folds:
+            filout.write(f"{energy}\t{to_bytes(code, size).hex()}\n")
+
+
+def read_folds(name):
+    """Read the (energy, code) pairs written by write_folds()"""
+    with open(name, "r") as filin:
+        return [(int(energy), from_bytes(bytes.fromhex(code))) for energy, code in
+                (line.split() for line in filin if line.strip())]
+
+
+class ConformationCache(object):
+    """
+        Bounded cache of the energies of visited conformations, keyed by their canonical code. When full, the
+        least recently used conformation is forgotten.
+
+        Attributes:
+        - capacity: Maximum number of conformations kept.
+        - hits, misses: Number of lookups that found or did not find the conformation.
+
+        Methods:
+        - get(code): Energy of a conformation, None if it is not in the cache.
+        - put(code, energy): Store the energy of a conformation.
+        - energy(code, score): Energy of a conformation, computed by score() only if it is not in the cache.
+        - folds(max_energy): Distinct conformations of the cache at or below an energy.
+
+        """
+
+    def __init__(self, capacity=100000):
+        """Create an empty cache of at most capacity conformations"""
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._energies = OrderedDict()
+
+    def __len__(self):
+        return len(self._energies)
+
+    def __contains__(self, code):
+        return code in self._energies
+
+    def get(self, code):
+        """Energy of a conformation, None if it is not in the cache"""
+        energy = self._energies.get(code)
+        if energy is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._energies.move_to_end(code)
+        return energy
+
+    def put(self, code, energy):
+        """Store the energy of a conformation, forgetting the least recently used one if the cache is full"""
+        self._energies[code] = energy
+        self._energies.move_to_end(code)
+        if len(self._energies) > self.capacity:
+            self._energies.popitem(last=False)
+
+    def energy(self, code, score):
+        """Energy of a conformation, score() is only called if the conformation is not in the cache"""
+        energy = self.get(code)
+        if energy is None:
+            energy = score()
+            self.put(code, energy)
+        return energy
+
+    def folds(self, max_energy=None):
+        """Distinct conformations of the cache at or below max_energy (all of them if None), as (energy, code)
+        pairs sorted by energy"""
+        return sorted((energy, code) for code, energy in self._energies.items()
+                      if max_energy is None or energy <= max_energy)
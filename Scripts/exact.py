@@ -0,0 +1,291 @@
+from chain import Chain, K_B
+from chain_state import ChainState, NEIGHBORS
+from fasta_parser import fasta_read
+from collections import Counter
+import argparse
+import math
+import sys
+import time
+
+MAX_SIZE = 30
+# Longest sequence whose conformations are all enumerated by energy_counts()
+MAX_ENUMERATION_SIZE = 16
+
+
+class GroundStateSearch(object):
+    """
+        Exact ground state of a short HP sequence, by a depth-first enumeration of the self-avoiding walks
+        with branch and bound.
+
+        - Symmetry breaking: the first bond goes along +x, and the first amino acid leaving the x axis goes
+          to +y, so every conformation is enumerated once instead of 8 times (4 rotations, 2 reflections).
+        - Pruning: a partial walk is abandoned when its contacts plus an upper bound of the contacts the
+          remaining amino acids can still form cannot beat the best conformation found. The bound counts at
+          most 2 new contacts per remaining H amino acid (3 for the last one), and only for those with an
+          earlier H of opposite index parity, as on the square lattice only residues of opposite parity can
+          be neighbours. The whole conformation cannot have more contacts than the smaller of the capacities
+          of the even and odd H amino acids either.
+
+        The contacts of every placed amino acid are scored with ChainState.local_energy(), the energy model
+        of the Monte Carlo programs, and the ground state is checked with ChainState.total_energy().
+
+        Attributes:
+        - state: ChainState receiving the partial walks, only the placed amino acids are in its occupancy.
+        - best_energy, best_conformation: Lowest energy conformation found.
+        - nodes: Number of partial walks visited by the last search.
+
+        Methods:
+        - solve(best_energy, best_conformation): Find a ground state, optionally starting from a known
+          conformation so that the search only looks for better ones.
+
+        """
+
+    def __init__(self, hp_sequence, max_size=MAX_SIZE):
+        """Prepare the search of an HP sequence of at most max_size amino acids"""
+        if len(hp_sequence) > max_size:
+            raise ValueError(f"Exact search is limited to {max_size} amino acids, the sequence has "
+                             f"{len(hp_sequence)}")
+        self.hp_sequence = hp_sequence
+        self.state = ChainState(hp_sequence)
+        self.best_energy = 0
+        self.best_conformation = None
+        self.nodes = 0
+        self._best_contacts = 0
+        self._future_contacts, self._max_contacts = self._contact_bounds()
+
+    def _contact_bounds(self):
+        """Upper bounds of the contacts: formed by the amino acids i, i + 1, ... with earlier ones, for every
+        i, and formed by the whole conformation"""
+        hp_flags = self.state.hp_flags
+        size = len(hp_flags)
+        capacities = [(3 if i in (0, size - 1) else 2) if hp_flags[i] else 0 for i in range(size)]
+        future = [0] * (size + 1)
+        for i in range(size - 1, -1, -1):
+            # Only a contact with an earlier H of opposite parity, at least 3 positions before, is possible
+            has_partner = any(hp_flags[j] for j in range(1 - i % 2, i - 2, 2))
+            later_capacity = 3 if i == size - 1 else 2
+            future[i] = future[i + 1] + (later_capacity if hp_flags[i] and has_partner else 0)
+        max_contacts = min(sum(capacities[0::2]), sum(capacities[1::2]))
+        return future, max_contacts
+
+    def solve(self, best_energy=None, best_conformation=None):
+        """
+            Find a ground state of the sequence.
+
+            Args:
+            - best_energy (int): Energy of a known conformation, e.g. found by Monte Carlo. Only strictly
+              lower energies are looked for, so it is returned as is if it is already a ground state.
+            - best_conformation (tuple): The known (xcoords, ycoords) conformation.
+
+            Returns:
+            - tuple: The ground state energy and its (xcoords, ycoords) conformation.
+
+            """
+        state = self.state
+        size = len(state)
+        self.nodes = 0
+        if best_conformation is None:
+            # The straight chain has no contact
+            best_energy, best_conformation = 0, (list(range(size)), [0] * size)
+        self._best_contacts = -best_energy
+        self.best_conformation = best_conformation
+
+        state.occupancy = {}
+        for i in range(min(size, 2)):
+            state.set_position(i, i, 0)
+        if size > 2 and self._best_contacts < self._max_contacts:
+            self._extend(2, 0, True)
+
+        self.best_energy = -self._best_contacts
+        check = ChainState(self.hp_sequence)
+        check.set_conformation(*self.best_conformation)
+        if not check.is_self_avoiding() or check.total_energy() != self.best_energy:
+            raise RuntimeError("The conformation found does not match its energy")
+        return self.best_energy, self.best_conformation
+
+    def _extend(self, index, contacts, straight):
+        """Place the amino acid at index next to the previous one, in every possible way"""
+        self.nodes += 1
+        state = self.state
+        occupancy = state.occupancy
+        bound = min(self._future_contacts[index], self._max_contacts - contacts)
+        if contacts + bound <= self._best_contacts:
+            return
+
+        x, y = state.xcoords[index - 1], state.ycoords[index - 1]
+        candidates = []
+        for dx, dy in NEIGHBORS:
+            site = (x + dx, y + dy)
+            # While the walk is straight, it may only turn to +y (reflection symmetry)
+            if site in occupancy or (straight and site[1] < 0):
+                continue
+            state.set_position(index, *site)
+            candidates.append((-state.local_energy((index,)), site))
+            del occupancy[site]
+        # The sites making the most contacts first, to find good conformations early and prune more
+        candidates.sort(reverse=True)
+
+        last = index == len(state) - 1
+        for gain, site in candidates:
+            if last:
+                if contacts + gain > self._best_contacts:
+                    state.set_position(index, *site)
+                    del occupancy[site]
+                    self._best_contacts = contacts + gain
+                    self.best_conformation = (list(state.xcoords), list(state.ycoords))
+                continue
+            state.set_position(index, *site)
+            self._extend(index + 1, contacts + gain, straight and site[1] == 0)
+            del occupancy[site]
+            if self._best_contacts >= self._max_contacts:
+                return
+
+
+def steps_to_energy(hp_sequence, target_energy, max_steps, temperature=None, seed=None, init_method="linear"):
+    """Number of Monte Carlo steps of folding.py needed to reach target_energy, None if not reached in
+    max_steps, to measure the convergence of the Monte Carlo runs against the ground state"""
+    chain = Chain(hp_sequence, seed=seed)
+    chain.initialize(init_method)
+    for step in range(1, max_steps + 1):
+        chain.step(temperature)
+        if chain.total_energy <= target_energy:
+            return step
+    return None
+
+
+def energy_counts(hp_sequence, max_size=MAX_ENUMERATION_SIZE):
+    """Number of conformations of every energy of a short HP sequence, by enumerating all the self-avoiding
+    walks whose first bond goes along +x. Every conformation is counted the same number of times, so the
+    counts give the exact density of states"""
+    if len(hp_sequence) > max_size:
+        raise ValueError(f"Enumeration is limited to {max_size} amino acids, the sequence has {len(hp_sequence)}")
+    state = ChainState(hp_sequence)
+    size = len(state)
+    counts = Counter()
+    state.occupancy = {}
+    for i in range(min(size, 2)):
+        state.set_position(i, i, 0)
+
+    def extend(index, energy):
+        if index == size:
+            counts[energy] += 1
+            return
+        x, y = state.xcoords[index - 1], state.ycoords[index - 1]
+        for dx, dy in NEIGHBORS:
+            site = (x + dx, y + dy)
+            if site in state.occupancy:
+                continue
+            state.set_position(index, *site)
+            extend(index + 1, energy + state.local_energy((index,)))
+            del state.occupancy[site]
+
+    extend(min(size, 2), 0)
+    return counts
+
+
+def boltzmann_distribution(hp_sequence, temperature):
+    """Exact probability of every energy at a temperature (K), from energy_counts()"""
+    counts = energy_counts(hp_sequence)
+    ground_energy = min(counts)
+    # Weights relative to the ground state, so that the exponentials cannot overflow
+    weights = {energy: count * math.exp(-(energy - ground_energy) / (temperature * K_B))
+               for energy, count in counts.items()}
+    total = sum(weights.values())
+    return {energy: weight / total for energy, weight in weights.items()}
+
+
+def sampled_distribution(hp_sequence, temperature, n_steps, seed=None, move_table=False):
+    """Frequency of every energy along a Monte Carlo run at a constant temperature from the linear
+    conformation, to check that the moves sample the Boltzmann distribution"""
+    chain = Chain(hp_sequence, seed=seed, move_table=move_table)
+    chain.initialize("linear")
+    visits = Counter()
+    for _ in range(n_steps):
+        chain.step(temperature)
+        visits[chain.total_energy] += 1
+    return {energy: count / n_steps for energy, count in visits.items()}
+
+
+def check_sampling(hp_sequence, temperature, n_steps, seed=None):
+    """
+        Compare the energy distributions sampled by Monte Carlo runs, with and without move table, with the
+        exact Boltzmann distribution.
+
+        Args:
+        - hp_sequence (str): HP sequence of at most MAX_ENUMERATION_SIZE amino acids.
+        - temperature (float): Temperature of the runs (K).
+        - n_steps (int): Number of steps of each run.
+        - seed (int): Seed of the runs.
+
+        Returns:
+        - tuple: The exact distribution and the sampled ones, energy -> probability dicts, and the largest
+          absolute difference between a sampled and the exact probability.
+
+        """
+    exact = boltzmann_distribution(hp_sequence, temperature)
+    sampled = [sampled_distribution(hp_sequence, temperature, n_steps, seed, move_table)
+               for move_table in (False, True)]
+    error = max(abs(distribution.get(energy, 0.0) - probability)
+                for distribution in sampled for energy, probability in exact.items())
+    return exact, sampled, error
+
+
+if __name__ == "__main__":
+    pa = argparse.ArgumentParser(description=("Program finding the exact ground state of a short HP protein"))
+    pa.usage = "exact.py fasta_input --mc-runs 10 --mc-steps 100000 --temp 160"
+    pa.add_argument("fasta_input", type=str, help="Name of the protein, at most 30 amino acids")
+    pa.add_argument("--hp-table", type=str, default="default",
+                    help=("hydrophobicity table: default, kyte-doolittle, or residues: followed by the "
+                          "hydrophobic residues, e.g. residues:AILMFVW"))
+    pa.add_argument("--max-size", type=int, default=MAX_SIZE,
+                    help=("longest sequence accepted, the search time grows exponentially with the length"))
+    pa.add_argument("--start-steps", type=int, default=20000,
+                    help=("Monte Carlo steps at 160 K finding a good conformation before the search, so that the "
+                          "search prunes more, 0 to start from the straight chain"))
+    pa.add_argument("--mc-runs", type=int, default=0,
+                    help=("number of Monte Carlo runs measuring the steps needed to reach the ground state"))
+    pa.add_argument("--mc-steps", type=int, default=100000, help=("maximum number of steps of a Monte Carlo run"))
+    pa.add_argument("--temp", type=float, default=None,
+                    help=("temperature (K) of the Monte Carlo runs, greedy descent by default"))
+    pa.add_argument("--no-plots", action="store_true", help=("do not draw the ground state"))
+    pa.add_argument("--check-sampling", type=int, default=0, metavar="STEPS",
+                    help=("compare the energies visited by Monte Carlo runs of STEPS steps at --temp (160 K by "
+                          "default) with the exact Boltzmann distribution, for sequences of at most "
+                          f"{MAX_ENUMERATION_SIZE} amino acids"))
+    args = pa.parse_args()
+
+    try:
+        hp_sequence = fasta_read(args.fasta_input, args.hp_table)
+    except ValueError as error:
+        pa.error(str(error))
+    if args.check_sampling:
+        temperature = args.temp or 160
+        try:
+            exact, (per_residue, tabled), error = check_sampling(hp_sequence, temperature, args.check_sampling, 0)
+        except ValueError as error:
+            sys.exit(str(error))
+        print(f"\nEnergy distribution at {temperature} K (exact, movement(), move table):")
+        for energy in sorted(exact):
+            print(f"{energy:5d} {exact[energy]:.4f} {per_residue.get(energy, 0.0):.4f} {tabled.get(energy, 0.0):.4f}")
+        print(f"Largest difference: {error:.4f}\n")
+        sys.exit()
+    try:
+        search = GroundStateSearch(hp_sequence, args.max_size)
+    except ValueError as error:
+        sys.exit(str(error))
+    start = time.perf_counter()
+    start_chain = Chain(hp_sequence, seed=0)
+    start_chain.initialize("linear")
+    start_chain.run(args.start_steps, 160)
+    energy, (xcoords, ycoords) = search.solve(start_chain.best_energy, start_chain.best_conformation)
+    print(f"\nGround state energy is {energy} ({search.nodes:,} partial walks in "
+          f"{time.perf_counter() - start:.2f} s)\n")
+    if not args.no_plots:
+        ground_state = Chain(hp_sequence)
+        ground_state.set_conformation(xcoords, ycoords)
+        ground_state.visualize_molecule("Ground_state")
+
+    for seed in range(args.mc_runs):
+        steps = steps_to_energy(hp_sequence, energy, args.mc_steps, args.temp, seed)
+        print(f"Monte Carlo run {seed}: " + (f"ground state reached after {steps} steps" if steps
+                                             else f"ground state not reached in {args.mc_steps} steps"))
@@ -1,28 +1,228 @@
-def fasta_read(name):
+import os
+import struct
+
+# Residues classified as hydrophobic (H), every other residue is polar (P). "default" is the historical set of
+# the program, "kyte-doolittle" the residues with a positive hydropathy index (Kyte and Doolittle 1982)
+HP_TABLES = {
+    "default": frozenset("VIFLMCWGPA"),
+    "kyte-doolittle": frozenset("IVLFCMA"),
+}
+# Prefix of a table given as its hydrophobic residues, e.g. "residues:AILMFVW"
+CUSTOM_TABLE = "residues:"
+# The 20 standard amino acids, then the ambiguity and rare residue codes, always polar unless in the table
+AMINO_ACIDS = frozenset("ACDEFGHIKLMNPQRSTVWY") | frozenset("BZJXUO")
+# Alignment gaps and the stop symbol are not residues, they are dropped
+SKIPPED = frozenset("-.*")
+
+# Offset index: magic, size and modification time of the indexed file, then one offset per record
+INDEX_HEADER = struct.Struct("<8sqq")
+INDEX_MAGIC = b"HPFIDX01"
+INDEX_OFFSET = struct.Struct("<q")
+
+
+def hydrophobic_residues(table="default"):
+    """Set of the hydrophobic residues of a table, given by its name in HP_TABLES or as the residues themselves
+    after CUSTOM_TABLE, e.g. "residues:AILMFVW". Any other name raises a ValueError"""
+    if table in HP_TABLES:
+        return HP_TABLES[table]
+    if table.startswith(CUSTOM_TABLE):
+        residues = frozenset(table[len(CUSTOM_TABLE):].upper())
+        if residues and residues <= AMINO_ACIDS:
+            return residues
+        raise ValueError(f"Invalid hydrophobicity table {table!r}, {CUSTOM_TABLE} should be followed by amino "
+                         f"acid codes")
+    raise ValueError(f"Unknown hydrophobicity table {table!r}, should be one of {', '.join(HP_TABLES)} "
+                     f"or {CUSTOM_TABLE} followed by the hydrophobic residues")
+
+
+def to_hp(sequence, table="default", record_id=""):
+    """
+    Convert an amino acid sequence into the HP model.
+
+    Lowercase residues (soft-masked regions) are read as uppercase, whitespace, gaps and stop symbols are
+    dropped. Any other character that is not an amino acid code raises a ValueError.
+
+    Args:
+    - sequence (str): The amino acid sequence.
+    - table (str): Hydrophobicity table, a name of HP_TABLES or "residues:" followed by the hydrophobic residues.
+    - record_id (str): Identifier of the record, for the error messages.
+
+    Returns:
+    - str: The HP sequence.
+
+    """
+    hydrophobic = hydrophobic_residues(table)
+    hp_sequence = []
+    for position, char in enumerate(''.join(sequence.split()).upper()):
+        if char in hydrophobic:
+            hp_sequence.append("H")
+        elif char in AMINO_ACIDS:
+            hp_sequence.append("P")
+        elif char not in SKIPPED:
+            raise ValueError(f"Invalid character {char!r} at position {position + 1} of record {record_id!r}")
+    return ''.join(hp_sequence)
+
+
+def fasta_read(name, table="default"):
     """
     Read a FASTA file, convert the protein sequence into an HP model, and return the HP sequence.
+    Only the first record is read, see fasta_records() for multi-FASTA files.
 
     Args:
     - name (str): The name of the FASTA file to read.
+    - table (str): Hydrophobicity table, see to_hp().
 
     Returns:
     - str: The HP sequence representing the protein.
 
     """
-    SEQ = []
-    # read the file and select only the sequence
+    for _, hp_sequence in fasta_records(name, table):
+        return hp_sequence
+    raise ValueError(f"No sequence in {name}")
+
+
+def fasta_records(name, table="default"):
+    """
+    Read a FASTA file record by record, without loading the whole file.
+
+    Args:
+    - name (str): The name of the FASTA file to read.
+    - table (str): Hydrophobicity table, see to_hp().
+
+    Yields:
+    - tuple: The identifier of the record (first word of its header) and its HP sequence.
+
+    """
     with open(name, "r") as filout:
-        for lines in filout:
-            if not lines.startswith(">"):
-                SEQ.extend(lines.strip())
-
-    # Change the sequence from amino acid to HP model
-    final_seq = []
-    for char in SEQ:
-        if char in "VIFLMCWGPAC":
-            final_seq.append("H")
-        else:
-            final_seq.append("P")
-
-    # return string of the final sequence in the HP model
-    return ''.join(final_seq)
+        yield from _parse_records(filout, table)
+
+
+def fasta_sequences(name):
+    """Read a FASTA file record by record without converting the sequences, yields (identifier, amino acid
+    sequence) pairs, so that an invalid record can be reported without stopping at it"""
+    with open(name, "r") as filin:
+        yield from _split_records(filin)
+
+
+def _parse_records(filin, table):
+    """Group lines of a FASTA file into (identifier, HP sequence) records"""
+    for record_id, sequence in _split_records(filin):
+        yield record_id, to_hp(sequence, table, record_id)
+
+
+def _split_records(filin):
+    """Group lines of a FASTA file into (identifier, sequence) records. Lines before the first header form a
+    record without identifier"""
+    record_id = None
+    sequence = []
+    for lines in filin:
+        if lines.startswith(">"):
+            if record_id is not None or sequence:
+                yield record_id or "", ''.join(sequence)
+            header = lines[1:].split()
+            record_id = header[0] if header else ""
+            sequence = []
+        elif lines.strip():
+            sequence.append(lines.strip())
+    if record_id is not None or sequence:
+        yield record_id or "", ''.join(sequence)
+
+
+def index_name(name):
+    """Name of the offset index of a FASTA file"""
+    return name + ".idx"
+
+
+def build_index(name):
+    """
+    Write the offset index of a FASTA file: the position of the header of every record, so that a record can
+    be read without scanning the records before it. The index is written to a temporary file then renamed,
+    so a reader never sees a partial index and two jobs indexing the same file do not truncate each other's.
+
+    Args:
+    - name (str): The name of the FASTA file.
+
+    Returns:
+    - int: Number of records.
+
+    """
+    stat = os.stat(name)
+    count = 0
+    offset = 0
+    temporary_name = f"{index_name(name)}.{os.getpid()}.tmp"
+    try:
+        with open(name, "rb") as filin, open(temporary_name, "wb") as filout:
+            filout.write(INDEX_HEADER.pack(INDEX_MAGIC, stat.st_size, stat.st_mtime_ns))
+            for line in filin:
+                # Sequence lines before the first header form a record, as in fasta_records()
+                if line.startswith(b">") or (count == 0 and line.strip()):
+                    filout.write(INDEX_OFFSET.pack(offset))
+                    count += 1
+                offset += len(line)
+        os.replace(temporary_name, index_name(name))
+    finally:
+        if os.path.exists(temporary_name):
+            os.remove(temporary_name)
+    return count
+
+
+def _open_index(name):
+    """Open the offset index of a FASTA file, built again if it is missing, damaged or older than the file"""
+    stat = os.stat(name)
+    try:
+        filin = open(index_name(name), "rb")
+    except FileNotFoundError:
+        filin = None
+    if filin is not None:
+        header = filin.read(INDEX_HEADER.size)
+        # A short header or a partial offset is a damaged index
+        size = os.fstat(filin.fileno()).st_size
+        if len(header) == INDEX_HEADER.size and (size - INDEX_HEADER.size) % INDEX_OFFSET.size == 0:
+            magic, file_size, mtime = INDEX_HEADER.unpack(header)
+            if (magic, file_size, mtime) == (INDEX_MAGIC, stat.st_size, stat.st_mtime_ns):
+                return filin
+        filin.close()
+    build_index(name)
+    filin = open(index_name(name), "rb")
+    filin.seek(INDEX_HEADER.size)
+    return filin
+
+
+def record_count(name):
+    """Number of records of a FASTA file, from its offset index"""
+    with _open_index(name) as filin:
+        filin.seek(0, os.SEEK_END)
+        return (filin.tell() - INDEX_HEADER.size) // INDEX_OFFSET.size
+
+
+def read_record(name, k, table="default"):
+    """
+    Read the record k (from 0) of a FASTA file by seeking to its offset, the index is built on first use.
+
+    Args:
+    - name (str): The name of the FASTA file.
+    - k (int): Number of the record.
+    - table (str): Hydrophobicity table, see to_hp().
+
+    Returns:
+    - tuple: The identifier of the record and its HP sequence.
+
+    """
+    # A negative position cannot be sought in the index
+    if k < 0:
+        raise IndexError(f"{name} has no record {k}")
+    with _open_index(name) as filin:
+        filin.seek(INDEX_HEADER.size + k * INDEX_OFFSET.size)
+        data = filin.read(INDEX_OFFSET.size)
+    if len(data) < INDEX_OFFSET.size:
+        raise IndexError(f"{name} has no record {k}")
+    offset, = INDEX_OFFSET.unpack(data)
+
+    with open(name, "rb") as filin:
+        filin.seek(offset)
+        lines = [filin.readline().decode()]
+        for line in filin:
+            if line.startswith(b">"):
+                break
+            lines.append(line.decode())
+    return next(_parse_records(lines, table))
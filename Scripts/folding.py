@@ -1,9 +1,12 @@
-import AminoAcidClass
-from fasta_parser import fasta_read
+from chain import Chain
+from checkpoint import save_checkpoint, load_checkpoint
+from trajectory import TrajectoryRecorder, EnergyHistory
+from instrumentation import MoveStatistics
+from codec import ConformationCache, encode, write_folds
+from schedules import SCHEDULES, build_schedule
+from fasta_parser import fasta_read, read_record
 import argparse
-import math
-import random
-import matplotlib.pyplot as plt
+from rendering import FrameRenderer, plot_energy
 from tqdm import tqdm
 
 pa = argparse.ArgumentParser(description=("Program to fold an HP protein by minimizing \
@@ -13,47 +16,169 @@ pa.add_argument("fasta_input", type=str, help="Name of the starting protein")
 pa.add_argument("iterations", type=int, help="Number of tries to move an amino acid")
 pa.add_argument("init_method", type=str, 
                 help="Initialization method, should be either linear or random")
+pa.add_argument("--hp-table", type=str, default="default",
+                help=("hydrophobicity table: default, kyte-doolittle, or residues: followed by the "
+                      "hydrophobic residues, e.g. residues:AILMFVW"))
+pa.add_argument("--record", type=int, default=None, metavar="K",
+                help=("fold the record K (from 0) of a multi-FASTA file, found with an offset index"))
 pa.add_argument("-s", "--sample", action="store_true",
                 help=("show the first 4 frames to track the moves"))
 pa.add_argument("-e", "--energy", action="store_true",
                 help=("Show the energy plot"))
-pa.add_argument("--temp", nargs=1, const=None, type=int, help=("value to get out of energy wells"))
+pa.add_argument("--no-plots", action="store_true",
+                help=("headless mode, do not draw anything (matplotlib is never imported)"))
+pa.add_argument("--temp", type=float, default=None,
+                help=("temperature (K) of the Metropolis criterion, to get out of energy wells, starting "
+                      "temperature of the --schedule"))
+pa.add_argument("--schedule", type=str, default="constant", choices=SCHEDULES,
+                help=("temperature schedule: constant --temp, linear or geometric cooling from --temp to "
+                      "--temp-end, or adaptive to keep the acceptance rate close to --target-acceptance"))
+pa.add_argument("--temp-end", type=float, default=None,
+                help=("final temperature of the linear and geometric schedules, --temp / 100 by default"))
+pa.add_argument("--target-acceptance", type=float, default=0.3,
+                help=("acceptance rate targeted by the adaptive schedule"))
+pa.add_argument("--reheat-after", type=int, default=0, metavar="K",
+                help=("go back to the starting temperature when the lowest energy has not improved for K moves"))
+pa.add_argument("--target-energy", type=int, default=None,
+                help=("stop the run as soon as this energy is reached"))
+pa.add_argument("--check-energy", type=int, default=0, metavar="K",
+                help=("debug mode, compare the running energy with a full recomputation every K moves"))
+pa.add_argument("--no-pull", action="store_true", help=("do not use the pull moves"))
+pa.add_argument("--move-table", action="store_true",
+                help=("keep a table of the legal moves and draw every move uniformly among them, no move is "
+                      "wasted on an amino acid without legal move but every step costs more: faster for about "
+                      "100 amino acids, slower in wall time for 500 and more, see benchmark.py --move-table"))
+pa.add_argument("--seed", type=int, default=None, help=("seed of the random generator"))
+pa.add_argument("--trajectory", type=str, default=None,
+                help=("binary file receiving the energy and accepted flag every --stride iterations"))
+pa.add_argument("--stride", type=int, default=1, help=("number of iterations between two trajectory records"))
+pa.add_argument("--conformations", action="store_true",
+                help=("also write the coordinates of every amino acid in the trajectory"))
+pa.add_argument("--plot-points", type=int, default=10000,
+                help=("maximum number of points kept in memory for the energy plot"))
+pa.add_argument("--plot-mode", type=str, default="downsample", choices=["downsample", "ring"],
+                help=("keep the whole run at a lower resolution (downsample) or only the last points (ring)"))
+pa.add_argument("--stats", type=str, default=None,
+                help=("JSON file receiving the counts, acceptance rates and timings of every move type"))
+pa.add_argument("--stats-every", type=int, default=0, metavar="N",
+                help=("print the rolling acceptance rates every N moves"))
+pa.add_argument("--folds", type=str, default=None,
+                help=("file receiving the distinct conformations found at the lowest energy, as canonical codes"))
+pa.add_argument("--fold-cache", type=int, default=100000, metavar="N",
+                help=("maximum number of low energy conformations kept for --folds"))
+pa.add_argument("--checkpoint", type=str, default="./Results/folding.ckpt",
+                help=("checkpoint file, written every --checkpoint-every iterations"))
+pa.add_argument("--checkpoint-every", type=int, default=0, metavar="N",
+                help=("save the simulation state every N iterations, 0 to disable"))
+pa.add_argument("--resume", action="store_true",
+                help=("continue the run saved in the checkpoint file instead of initializing a new one"))
 
 args = pa.parse_args()
 
 if __name__ == "__main__":
-    prot_seq = fasta_read(args.fasta_input)
-    amino_acids = [AminoAcidClass.AminoAcid(i + 1, char) for i, char in enumerate(prot_seq)]
+    try:
+        if args.record is None:
+            prot_seq = fasta_read(args.fasta_input, args.hp_table)
+        else:
+            prot_seq = read_record(args.fasta_input, args.record, args.hp_table)[1]
+    except (ValueError, IndexError) as error:
+        pa.error(str(error))
+    chain = Chain(prot_seq, seed=args.seed, check_interval=args.check_energy, pull_moves=not args.no_pull,
+                  move_table=args.move_table)
+    if args.stats or args.stats_every:
+        chain.stats = MoveStatistics(chain.move_types(), callback=lambda stats: tqdm.write(stats.summary()),
+                                     callback_every=args.stats_every)
     num_iterations = args.iterations
+    try:
+        schedule = build_schedule(args.schedule, args.temp, args.temp_end, num_iterations, args.target_acceptance,
+                                  args.reheat_after)
+    except ValueError as error:
+        pa.error(str(error))
+
+    if args.resume:
+        saved = load_checkpoint(args.checkpoint)
+        chain.set_state(saved["chain"])
+        # Checkpoints written before the schedules only hold the temperature
+        schedule = saved["schedule"] if "schedule" in saved else build_schedule("constant", saved["temperature"])
+        start_iteration = saved["iteration"]
+        energy_values = saved["energy_values"]
+        frame = saved["frame"]
+        trajectory_offset = saved["trajectory_offset"]
+        fold_cache = saved.get("folds")
+        print(f"\nResuming at iteration {start_iteration} with energy {chain.total_energy}\n")
+    else:
+        chain.initialize(args.init_method)
+
+        print(f"\nStarting energy is {chain.calculate_total_energy()}\n")
+        if not args.no_plots:
+            chain.visualize_molecule("Start")
+
+        start_iteration = 0
+        energy_values = EnergyHistory(args.plot_points, args.plot_mode)
+        frame = 1
+        trajectory_offset = None
+        fold_cache = None
+
+    if args.folds and fold_cache is None:
+        fold_cache = ConformationCache(args.fold_cache)
+        fold_cache.put(encode(chain.state.xcoords, chain.state.ycoords), chain.total_energy)
+    # Only the conformations at or below the lowest energy found so far are encoded
+    lowest_fold_energy = min(energy for energy, _ in fold_cache.folds()) if fold_cache else None
+
+    renderer = FrameRenderer()
+    recorder = None
+    if args.trajectory:
+        recorder = TrajectoryRecorder(args.trajectory, len(chain), args.stride, args.conformations,
+                                      resume_offset=trajectory_offset)
+
+    temperature = schedule.temperature
+    for i in tqdm(range(start_iteration, num_iterations), desc="Working on the moves, please wait ...",
+                  initial=start_iteration, total=num_iterations):
+        move_accepted = chain.step(temperature)
+        temperature = schedule.update(move_accepted, chain.total_energy)
+
+        if recorder is not None:
+            recorder.record(i, chain.total_energy, move_accepted, chain.state)
 
-    AminoAcidClass.AminoAcid.initialize(args.init_method)
-    
-    print(f"\nStarting energy is {AminoAcidClass.AminoAcid.calculate_total_energy()}\n")
-    AminoAcidClass.AminoAcid.visualize_molecule("Start")
-    
-    energy_values = []
-    frame = 1
-    for i in tqdm(range(num_iterations), desc="Working on the moves, please wait ..."):
-        random_amino_acid = random.choice(AminoAcidClass.AminoAcid._registry)
-        move_accepted = random_amino_acid.movement(args.temp)
-        
         if move_accepted:
-            energy = AminoAcidClass.AminoAcid.calculate_total_energy()
-            energy_values.append(energy)
+            energy = chain.total_energy
+            energy_values.append(i, energy)
+
+            if fold_cache is not None and energy <= lowest_fold_energy:
+                fold_cache.put(encode(chain.state.xcoords, chain.state.ycoords), energy)
+                lowest_fold_energy = energy
         
-            if frame < 5 and args.sample:
-                AminoAcidClass.AminoAcid.visualize_molecule(f"Frame_{frame}")
+            if frame < 5 and args.sample and not args.no_plots:
+                renderer.submit(chain, f"Frame_{frame}")
                 frame += 1
 
-    AminoAcidClass.AminoAcid.visualize_molecule("End")
-    print(f"\nFinal energy is {AminoAcidClass.AminoAcid.calculate_total_energy()}\n")
-    
-    
-    plt.close('all')
-    # Plot the energy values
-    if args.energy:
-        plt.plot(energy_values)
-        plt.xlabel("Iteration")
-        plt.ylabel("Energy")
-        plt.title("Energy per Iteration")
-        plt.savefig("./Results/energy.png")
+        if args.checkpoint_every and (i + 1) % args.checkpoint_every == 0:
+            save_checkpoint(args.checkpoint, {"chain": chain.get_state(), "schedule": schedule,
+                                              "iteration": i + 1, "energy_values": energy_values,
+                                              "frame": frame, "folds": fold_cache,
+                                              "trajectory_offset": recorder.tell() if recorder else None})
+
+        if args.target_energy is not None and chain.total_energy <= args.target_energy:
+            tqdm.write(f"\nTarget energy {args.target_energy} reached after {i + 1} iterations")
+            break
+
+    if recorder is not None:
+        recorder.close()
+
+    renderer.close()
+    if args.stats:
+        chain.stats.dump(args.stats)
+    if fold_cache is not None:
+        lowest_folds = fold_cache.folds(lowest_fold_energy)
+        write_folds(args.folds, lowest_folds, len(chain))
+        print(f"\n{len(lowest_folds)} distinct conformations found at energy {lowest_fold_energy}")
+    if schedule.reheats:
+        print(f"\n{schedule.reheats} reheats, final temperature {schedule.temperature:.1f} K")
+    print(f"\nFinal energy is {chain.calculate_total_energy()}, best energy is {chain.best_energy}\n")
+
+    if not args.no_plots:
+        chain.visualize_molecule("End")
+        chain.visualize_molecule("Best", best=True)
+        # Plot the energy values
+        if args.energy:
+            plot_energy(energy_values.iterations, energy_values.energies)
@@ -0,0 +1,103 @@
+import json
+from collections import deque
+
+
+class MoveStatistics(object):
+    """
+        Counters and timers of the Monte Carlo moves, filled by Chain.movement() when given to a Chain.
+        A Chain without statistics only pays one attribute test per move.
+
+        For every move type:
+        - proposed: The move type was looked for on the chosen amino acid.
+        - valid: At least one legal move of this type was found.
+        - selected: The move type was chosen and applied.
+        - accepted: The applied move was kept.
+
+        Attributes:
+        - phase_times: Cumulative time (s) spent listing the moves (enumeration), scoring them (energy) and
+          accepting or reverting them (bookkeeping).
+        - window: Number of selected moves of each type used for the rolling acceptance rates.
+
+        Methods:
+        - rolling_acceptance(): Acceptance rate of the last selected moves of each type.
+        - to_dict(): All the statistics as a JSON-serializable dict.
+        - dump(name): Write the statistics to a JSON file.
+        - summary(): One line summary of the rolling acceptance rates.
+
+        """
+
+    def __init__(self, move_types, window=1000, callback=None, callback_every=0):
+        """
+            Create empty statistics.
+
+            Args:
+            - move_types (iterable): Names of the move types.
+            - window (int): Number of selected moves of each type used for the rolling acceptance rates.
+            - callback (function): Called with the statistics every callback_every moves, for live monitoring.
+            - callback_every (int): Number of moves between two calls of the callback.
+
+            """
+        self.move_types = tuple(move_types)
+        self.window = window
+        self.callback = callback
+        self.callback_every = callback_every
+        self.proposed = dict.fromkeys(self.move_types, 0)
+        self.valid = dict.fromkeys(self.move_types, 0)
+        self.selected = dict.fromkeys(self.move_types, 0)
+        self.accepted = dict.fromkeys(self.move_types, 0)
+        self.phase_times = {"enumeration": 0.0, "energy": 0.0, "bookkeeping": 0.0}
+        self.moves = 0
+        self._recent = {move_type: deque(maxlen=window) for move_type in self.move_types}
+
+    def add_time(self, phase, seconds):
+        """Add time spent in a phase of the moves"""
+        self.phase_times[phase] += seconds
+
+    def count_possible(self, move_types, possible_moves):
+        """Count the move types looked for and those with at least one legal move"""
+        self.moves += 1
+        for move_type in move_types:
+            self.proposed[move_type] += 1
+        for move_type in {move_type for move_type, _ in possible_moves}:
+            self.valid[move_type] += 1
+        if self.callback is not None and self.callback_every and self.moves % self.callback_every == 0:
+            self.callback(self)
+
+    def count_result(self, move_type, accepted):
+        """Count a selected move and whether it was accepted"""
+        self.selected[move_type] += 1
+        if accepted:
+            self.accepted[move_type] += 1
+        self._recent[move_type].append(accepted)
+
+    def rolling_acceptance(self):
+        """Acceptance rate of the last selected moves of each type, None if the type was never selected"""
+        return {move_type: sum(recent) / len(recent) if recent else None
+                for move_type, recent in self._recent.items()}
+
+    def to_dict(self):
+        """All the statistics as a JSON-serializable dict"""
+        return {
+            "moves": self.moves,
+            "move_types": {move_type: {
+                "proposed": self.proposed[move_type],
+                "valid": self.valid[move_type],
+                "selected": self.selected[move_type],
+                "accepted": self.accepted[move_type],
+                "acceptance": (self.accepted[move_type] / self.selected[move_type]
+                               if self.selected[move_type] else None),
+            } for move_type in self.move_types},
+            "rolling_acceptance": self.rolling_acceptance(),
+            "phase_times": self.phase_times,
+        }
+
+    def dump(self, name):
+        """Write the statistics to a JSON file"""
+        with open(name, "w") as filout:
+            json.dump(self.to_dict(), filout, indent=2)
+
+    def summary(self):
+        """One line summary of the rolling acceptance rates, for live monitoring"""
+        rates = ", ".join(f"{move_type} {rate:.1%}" for move_type, rate in self.rolling_acceptance().items()
+                          if rate is not None)
+        return f"{self.moves} moves, rolling acceptance: {rates}"
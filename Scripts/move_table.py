@@ -0,0 +1,155 @@
+# Sites at a lattice distance of at most 3, the farthest site whose occupancy decides a move of an amino acid
+# (the crankshaft move of the pair formed with its previous neighbour), with their lattice distance
+NEARBY = tuple((dx, dy, abs(dx) + abs(dy)) for dx in range(-3, 4) for dy in range(-3, 4)
+               if 0 < abs(dx) + abs(dy) <= 3)
+
+
+class MoveTable(object):
+    """
+        Table of the legal moves of every amino acid, kept up to date after each move, so that a legal move
+        can be drawn uniformly without listing the moves of the whole chain at every step.
+
+        A move of an amino acid only depends on the positions of its neighbours in the chain (up to 2 away) and
+        on the occupancy of a few sites around it: the 8 sites of the surrounding square (corner and pull moves),
+        the sites up to 2 away for the ends of the chain (end moves and pulls of the whole chain), and up to 3
+        away for the amino acids of a U shape (crankshaft moves). After a move, only the amino acids close to
+        the moved ones in the chain, and those depending on a site freed or newly taken, get their moves listed
+        again.
+        The counts are kept in a Fenwick tree to draw a move in O(log N).
+
+        Pull moves are stored as descriptors (see ChainState.pull_descriptors()) because their changes depend on
+        the positions of the whole pulled segment, the changes are built when the move is drawn. The pull moves
+        only displacing one amino acid are left out, they are already listed as end or corner moves.
+
+        Attributes:
+        - moves: Legal moves of each amino acid, as (move type, changes or pull descriptor) tuples.
+        - total: Number of legal moves of the chain.
+
+        Methods:
+        - rebuild(): List the moves of every amino acid.
+        - sample(rng): Draw a legal move uniformly.
+        - changes(move): Get the changes of a drawn move.
+        - count(changes): Number of listings of a move in the table.
+        - update(changes, previous): Refresh the moves around the amino acids moved by a move.
+        - restore(undo): Undo an update, after a rejected move has been reverted.
+
+        """
+
+    def __init__(self, state, pull_moves=True):
+        """Build the table of a ChainState"""
+        self.state = state
+        self.pull_moves = pull_moves
+        self.rebuild()
+
+    def rebuild(self):
+        """List the moves of every amino acid"""
+        size = len(self.state)
+        self.moves = [self._legal_moves(index) for index in range(size)]
+        self.total = sum(len(moves) for moves in self.moves)
+        # Fenwick tree of the number of moves per amino acid, built in O(N)
+        self._tree = [0] * (size + 1)
+        for position in range(1, size + 1):
+            self._tree[position] += len(self.moves[position - 1])
+            parent = position + (position & -position)
+            if parent <= size:
+                self._tree[parent] += self._tree[position]
+
+    def _legal_moves(self, index):
+        """Legal moves of an amino acid as (move type, changes or pull descriptor) tuples"""
+        return self.state.residue_moves(index, self.pull_moves)
+
+    def _add(self, index, delta):
+        """Add delta to the number of moves of an amino acid in the Fenwick tree"""
+        position = index + 1
+        size = len(self._tree) - 1
+        while position <= size:
+            self._tree[position] += delta
+            position += position & -position
+        self.total += delta
+
+    def sample(self, rng):
+        """Draw a legal move uniformly, None if there is no legal move"""
+        if self.total == 0:
+            return None
+        target = rng.randrange(self.total)
+        # Descend the Fenwick tree to the amino acid holding the target-th move
+        position = 0
+        bit = 1 << (len(self._tree) - 1).bit_length()
+        while bit:
+            next_position = position + bit
+            if next_position < len(self._tree) and self._tree[next_position] <= target:
+                position = next_position
+                target -= self._tree[next_position]
+            bit >>= 1
+        return self.moves[position][target]
+
+    def changes(self, move):
+        """Get the changes (index -> new coordinates) of a move drawn by sample()"""
+        return self.state.move_changes(move)
+
+    def count(self, changes):
+        """Number of listings of a move with these changes in the table. Only the amino acids at both ends of
+        the moved segment can list it, a crankshaft move is listed by both amino acids of its pair"""
+        return sum(self.state.count_moves(self.moves[end], changes) for end in {min(changes), max(changes)})
+
+    def update(self, changes, previous):
+        """
+            Refresh the moves around the amino acids moved by a move that has been applied.
+
+            Args:
+            - changes (dict): The applied changes, index -> new coordinates.
+            - previous (dict): The coordinates before the move, index -> old coordinates.
+
+            Returns:
+            - list: (index, old moves) of the refreshed amino acids, to undo the update with restore().
+
+            """
+        state = self.state
+        size = len(state)
+        touched = set()
+        for index in changes:
+            touched.update(range(max(0, index - 2), min(size, index + 3)))
+        # A site left by an amino acid and taken by another one (the pulled segment of a pull move) is still
+        # occupied, only the sites freed or newly taken change the moves around them
+        occupancy = state.occupancy
+        for x, y in set(changes.values()).symmetric_difference(previous.values()):
+            for dx, dy, distance in NEARBY:
+                neighbor = occupancy.get((x + dx, y + dy))
+                if neighbor is None or neighbor in touched:
+                    continue
+                if abs(dx) <= 1 and abs(dy) <= 1:
+                    touched.add(neighbor)
+                elif neighbor == 0 or neighbor == size - 1:
+                    if distance == 2:
+                        touched.add(neighbor)
+                elif self._in_u_shape(neighbor):
+                    touched.add(neighbor)
+
+        undo = []
+        for index in touched:
+            old_moves = self.moves[index]
+            new_moves = self._legal_moves(index)
+            self.moves[index] = new_moves
+            if len(new_moves) != len(old_moves):
+                self._add(index, len(new_moves) - len(old_moves))
+            undo.append((index, old_moves))
+        return undo
+
+    def _in_u_shape(self, index):
+        """Whether an amino acid belongs to a pair that can make a crankshaft move, i.e. the amino acids holding
+        the pair are neighbours on the lattice and the four of them form a square"""
+        state = self.state
+        xs, ys = state.xcoords, state.ycoords
+        for first in (index - 1, index):
+            if 1 <= first and first + 2 < len(xs) and \
+                    abs(xs[first - 1] - xs[first + 2]) + abs(ys[first - 1] - ys[first + 2]) == 1:
+                return True
+        return False
+
+    def restore(self, undo):
+        """Undo an update, after the move has been reverted"""
+        for index, old_moves in undo:
+            delta = len(old_moves) - len(self.moves[index])
+            self.moves[index] = old_moves
+            if delta:
+                self._add(index, delta)
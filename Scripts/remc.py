@@ -0,0 +1,226 @@
+from chain import Chain, K_B
+from checkpoint import save_checkpoint, load_checkpoint
+from fasta_parser import fasta_read
+import argparse
+import math
+import random
+from multiprocessing import Pool
+
+
+def geometric_ladder(t_min, t_max, n_replicas):
+    """Temperatures spaced geometrically between t_min and t_max, the usual choice for REMC"""
+    if n_replicas == 1:
+        return [t_min]
+    ratio = (t_max / t_min) ** (1 / (n_replicas - 1))
+    return [t_min * ratio ** k for k in range(n_replicas)]
+
+
+def _run_segment(task):
+    """
+    Run the Monte Carlo steps of one replica between two exchanges. Used by the worker processes,
+    the replica is rebuilt from its coordinates and random generator state so that only a few arrays are
+    sent between processes.
+
+    Args:
+    - task (tuple): HP sequence, x and y coordinates, random generator state, temperature and number of steps.
+
+    Returns:
+    - tuple: New coordinates, energy, random generator state, accepted moves, best energy and best coordinates.
+
+    """
+    hp_sequence, xcoords, ycoords, rng_state, temperature, n_steps = task
+    chain = Chain(hp_sequence)
+    chain.set_conformation(xcoords, ycoords)
+    chain.rng.setstate(rng_state)
+    accepted = chain.run(n_steps, temperature)
+    xcoords, ycoords = chain.state.conformation()
+    return (xcoords, ycoords, chain.total_energy, chain.rng.getstate(), accepted,
+            chain.best_energy, chain.best_conformation)
+
+
+class ReplicaExchange(object):
+    """
+        Replica-Exchange Monte Carlo: one replica of the chain per temperature of the ladder, neighbouring
+        replicas try to swap their conformations every exchange_interval steps.
+
+        Attributes:
+        - temperatures: Temperature ladder, one replica per temperature.
+        - replicas: Chain of each temperature.
+        - swap_attempts, swap_accepted: Number of exchanges tried and accepted between temperatures k and k+1.
+        - best_energy, best_conformation: Lowest energy conformation seen by any replica.
+
+        Methods:
+        - run(n_steps, exchange_interval, workers): Run the simulation.
+        - exchange(): Try to swap the conformations of neighbouring replicas.
+        - get_state(), set_state(state): Save and restore the whole simulation state, for checkpoints.
+        - swap_rates(): Acceptance rate of the exchanges between neighbouring temperatures.
+
+        """
+
+    def __init__(self, hp_sequence, temperatures, init_method="linear", seed=None):
+        """Create and initialize one replica per temperature"""
+        self.hp_sequence = hp_sequence
+        self.temperatures = list(temperatures)
+        self.rng = random.Random(seed)
+        self.replicas = []
+        for _ in self.temperatures:
+            replica = Chain(hp_sequence, seed=self.rng.getrandbits(64))
+            replica.initialize(init_method)
+            self.replicas.append(replica)
+        self.swap_attempts = [0] * (len(self.temperatures) - 1)
+        self.swap_accepted = [0] * (len(self.temperatures) - 1)
+        self.accepted_moves = [0] * len(self.temperatures)
+        self.best_energy = self.replicas[0].total_energy
+        self.best_conformation = self.replicas[0].state.conformation()
+        self._exchanges_done = 0
+        self.steps_done = 0
+
+    def run(self, n_steps, exchange_interval=100, workers=1, checkpoint=None, checkpoint_every=0):
+        """
+            Run the moves of every replica up to n_steps, with an exchange attempt every exchange_interval steps.
+            A resumed simulation continues from the number of steps already done.
+
+            Args:
+            - n_steps (int): Number of moves tried by each replica.
+            - exchange_interval (int): Number of moves between two exchange attempts.
+            - workers (int): Number of processes running the replicas, 1 runs them in this process.
+            - checkpoint (str): Name of the checkpoint file.
+            - checkpoint_every (int): Save the simulation state about every checkpoint_every steps, 0 to disable.
+
+            """
+        pool = Pool(workers) if workers > 1 else None
+        try:
+            while self.steps_done < n_steps:
+                segment = min(exchange_interval, n_steps - self.steps_done)
+                if pool is None:
+                    results = [(replica.run(segment, temperature), replica.best_energy, replica.best_conformation)
+                               for replica, temperature in zip(self.replicas, self.temperatures)]
+                else:
+                    results = self._run_parallel(pool, segment)
+                for k, (accepted, best_energy, best_conformation) in enumerate(results):
+                    self.accepted_moves[k] += accepted
+                    if best_energy < self.best_energy:
+                        self.best_energy = best_energy
+                        self.best_conformation = best_conformation
+                self.steps_done += segment
+                self.exchange()
+                if checkpoint and checkpoint_every and \
+                        self.steps_done // checkpoint_every > (self.steps_done - segment) // checkpoint_every:
+                    save_checkpoint(checkpoint, self.get_state())
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+    def _run_parallel(self, pool, segment):
+        """Run one segment of every replica on the process pool and update the replicas with the results"""
+        tasks = [(self.hp_sequence, *replica.state.conformation(), replica.rng.getstate(), temperature, segment)
+                 for replica, temperature in zip(self.replicas, self.temperatures)]
+        results = []
+        for replica, result in zip(self.replicas, pool.map(_run_segment, tasks)):
+            xcoords, ycoords, energy, rng_state, accepted, best_energy, best_conformation = result
+            replica.state.set_conformation(xcoords, ycoords)
+            replica.total_energy = energy
+            replica.set_best(best_energy, best_conformation)
+            replica.rng.setstate(rng_state)
+            results.append((accepted, best_energy, best_conformation))
+        return results
+
+    def exchange(self):
+        """Try to swap the conformations of neighbouring replicas, alternating between the even and odd pairs.
+        The swap of temperatures k and k+1 is accepted with probability min(1, exp((beta_k - beta_k+1)(E_k - E_k+1)))"""
+        for k in range(self._exchanges_done % 2, len(self.replicas) - 1, 2):
+            low, high = self.replicas[k], self.replicas[k + 1]
+            delta = ((1 / (K_B * self.temperatures[k]) - 1 / (K_B * self.temperatures[k + 1])) *
+                     (low.total_energy - high.total_energy))
+            self.swap_attempts[k] += 1
+            if delta >= 0 or self.rng.random() < math.exp(delta):
+                self.swap_accepted[k] += 1
+                # Swapping the chains keeps every temperature in place, each chain keeps its own random generator
+                self.replicas[k], self.replicas[k + 1] = high, low
+        self._exchanges_done += 1
+
+    def get_state(self):
+        """Get everything needed to continue the simulation identically, as a picklable dict"""
+        return {
+            "temperatures": self.temperatures,
+            "replicas": [replica.get_state() for replica in self.replicas],
+            "rng_state": self.rng.getstate(),
+            "swap_attempts": self.swap_attempts,
+            "swap_accepted": self.swap_accepted,
+            "accepted_moves": self.accepted_moves,
+            "best_energy": self.best_energy,
+            "best_conformation": self.best_conformation,
+            "exchanges_done": self._exchanges_done,
+            "steps_done": self.steps_done,
+        }
+
+    def set_state(self, state):
+        """Restore a state returned by get_state()"""
+        self.temperatures = list(state["temperatures"])
+        self.replicas = []
+        for replica_state in state["replicas"]:
+            replica = Chain(self.hp_sequence)
+            replica.set_state(replica_state)
+            self.replicas.append(replica)
+        self.rng.setstate(state["rng_state"])
+        self.swap_attempts = list(state["swap_attempts"])
+        self.swap_accepted = list(state["swap_accepted"])
+        self.accepted_moves = list(state["accepted_moves"])
+        self.best_energy = state["best_energy"]
+        self.best_conformation = state["best_conformation"]
+        self._exchanges_done = state["exchanges_done"]
+        self.steps_done = state["steps_done"]
+
+    def swap_rates(self):
+        """Acceptance rate of the exchanges between temperatures k and k+1"""
+        return [accepted / attempts if attempts else 0.0
+                for accepted, attempts in zip(self.swap_accepted, self.swap_attempts)]
+
+
+if __name__ == "__main__":
+    pa = argparse.ArgumentParser(description=("Program to fold an HP protein with Replica-Exchange Monte Carlo"))
+    pa.usage = "remc.py fasta_input iterations init_method --temps T1 T2 ... --workers N"
+    pa.add_argument("fasta_input", type=str, help="Name of the starting protein")
+    pa.add_argument("iterations", type=int, help="Number of tries to move an amino acid, per replica")
+    pa.add_argument("init_method", type=str,
+                    help="Initialization method, should be either linear or random")
+    pa.add_argument("--hp-table", type=str, default="default",
+                    help=("hydrophobicity table: default, kyte-doolittle, or residues: followed by the "
+                          "hydrophobic residues, e.g. residues:AILMFVW"))
+    pa.add_argument("--temps", nargs="+", type=float, default=None,
+                    help=("temperature ladder (K), overrides --tmin, --tmax and --replicas"))
+    pa.add_argument("--tmin", type=float, default=160, help=("lowest temperature of the ladder (K)"))
+    pa.add_argument("--tmax", type=float, default=220, help=("highest temperature of the ladder (K)"))
+    pa.add_argument("--replicas", type=int, default=5, help=("number of replicas"))
+    pa.add_argument("--exchange", type=int, default=500, help=("number of moves between two exchange attempts"))
+    pa.add_argument("--workers", type=int, default=1, help=("number of processes running the replicas"))
+    pa.add_argument("--seed", type=int, default=None, help=("seed of the random generator"))
+    pa.add_argument("--checkpoint", type=str, default="./Results/remc.ckpt",
+                    help=("checkpoint file, written every --checkpoint-every iterations"))
+    pa.add_argument("--checkpoint-every", type=int, default=0, metavar="N",
+                    help=("save the simulation state about every N iterations, 0 to disable"))
+    pa.add_argument("--resume", action="store_true",
+                    help=("continue the run saved in the checkpoint file instead of initializing a new one"))
+    args = pa.parse_args()
+
+    temperatures = args.temps or geometric_ladder(args.tmin, args.tmax, args.replicas)
+    try:
+        hp_sequence = fasta_read(args.fasta_input, args.hp_table)
+    except ValueError as error:
+        pa.error(str(error))
+    remc = ReplicaExchange(hp_sequence, temperatures, args.init_method, seed=args.seed)
+    if args.resume:
+        remc.set_state(load_checkpoint(args.checkpoint))
+        print(f"\nResuming at iteration {remc.steps_done} with best energy {remc.best_energy}\n")
+    else:
+        print(f"\nStarting energy is {remc.best_energy}\n")
+    remc.run(args.iterations, args.exchange, args.workers, args.checkpoint, args.checkpoint_every)
+
+    for k, rate in enumerate(remc.swap_rates()):
+        print(f"Swap {remc.temperatures[k]:.1f}K <-> {remc.temperatures[k + 1]:.1f}K : {rate:.1%} accepted")
+    print(f"\nBest energy is {remc.best_energy}\n")
+
+    best_chain = Chain(remc.hp_sequence)
+    best_chain.set_conformation(*remc.best_conformation)
+    best_chain.visualize_molecule("REMC_best")
@@ -0,0 +1,86 @@
+from concurrent.futures import ProcessPoolExecutor
+
+RESULTS_FOLDER = "./Results/"
+
+
+def draw_molecule(hp_sequence, xcoords, ycoords, name, folder=RESULTS_FOLDER):
+    """
+    Draw a conformation and save it as a PNG file.
+
+    Args:
+    - hp_sequence (str): The HP sequence of the chain.
+    - xcoords, ycoords (sequence of int): The coordinates of the amino acids.
+    - name (str): The name of the image, without extension.
+    - folder (str): The folder receiving the image.
+
+    """
+    # matplotlib is only imported when something is drawn, so headless runs never load it.
+    # A bare Figure is not registered by pyplot, so it is freed once saved
+    from matplotlib.figure import Figure
+
+    figure = Figure(figsize=(15, 15))
+    ax = figure.add_subplot()
+    # Draw lines connecting amino acids
+    ax.plot(xcoords, ycoords, 'black', zorder=1)
+    for class_hp, marker, label in (('P', 'ro', 'P Class'), ('H', 'bs', 'H Class')):
+        indices = [i for i, char in enumerate(hp_sequence) if char == class_hp]
+        ax.plot([xcoords[i] for i in indices], [ycoords[i] for i in indices], marker, markersize=5, zorder=2,
+                label=label)
+
+    ax.set_title('Amino Acid Molecule Visualization')
+    ax.legend()
+    figure.savefig(folder + name + ".png")
+
+
+def plot_energy(iterations, energies, name="energy", folder=RESULTS_FOLDER):
+    """Plot the energy along the run and save it as a PNG file"""
+    from matplotlib.figure import Figure
+
+    figure = Figure()
+    ax = figure.add_subplot()
+    ax.plot(iterations, energies)
+    ax.set_xlabel("Iteration")
+    ax.set_ylabel("Energy")
+    ax.set_title("Energy per Iteration")
+    figure.savefig(folder + name + ".png")
+
+
+class FrameRenderer(object):
+    """
+        Draws the conformations in a background process, so the Monte Carlo loop only pays for copying the
+        coordinates and never waits for matplotlib or the PNG encoding.
+
+        Methods:
+        - submit(chain, name): Draw a snapshot of the current conformation of a chain.
+        - close(): Wait for the pending drawings.
+
+        """
+
+    def __init__(self, folder=RESULTS_FOLDER):
+        """The worker process is only started by the first drawing"""
+        self.folder = folder
+        self._executor = None
+        self._pending = []
+
+    def submit(self, chain, name):
+        """Draw a snapshot of the current conformation of a chain"""
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=1)
+        xcoords, ycoords = chain.state.conformation()
+        self._pending.append(self._executor.submit(draw_molecule, chain.state.hp_sequence, xcoords, ycoords,
+                                                  name, self.folder))
+
+    def close(self):
+        """Wait for the pending drawings and stop the worker process, errors of the drawings are raised here"""
+        if self._executor is not None:
+            for future in self._pending:
+                future.result()
+            self._executor.shutdown()
+            self._executor = None
+        self._pending = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
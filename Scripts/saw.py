@@ -0,0 +1,81 @@
+import random
+
+# The 7 symmetries of the square lattice other than the identity: rotations by 90, 180 and 270 degrees,
+# then the reflections across both axes and both diagonals, as functions of the position relative to the pivot
+SYMMETRIES = (
+    lambda dx, dy: (-dy, dx),
+    lambda dx, dy: (-dx, -dy),
+    lambda dx, dy: (dy, -dx),
+    lambda dx, dy: (dx, -dy),
+    lambda dx, dy: (-dx, dy),
+    lambda dx, dy: (dy, dx),
+    lambda dx, dy: (-dy, -dx),
+)
+
+
+def random_walk(size, rng=None, pivots=100):
+    """
+        Random self-avoiding walk on the square lattice, obtained with the pivot algorithm (Madras and Sokal
+        1988) from a straight chain: a random amino acid is chosen as pivot and a random lattice symmetry is
+        applied around it to the shorter part of the chain, the result is kept if it is still self-avoiding.
+
+        The walk is self-avoiding at every step, so the generation never fails nor restarts. The occupied
+        sites are hashed, a pivot attempt costs at most the length of the moved part, so the walk is built in
+        O(pivots * size).
+
+        Args:
+        - size (int): Number of amino acids.
+        - rng (random.Random): Random generator, a new unseeded one if None.
+        - pivots (int): Number of accepted pivots. A few tens of pivots already lose the memory of the straight
+          chain, as each one reorients a large part of it.
+
+        Returns:
+        - tuple: (xcoords, ycoords) lists.
+
+        """
+    if rng is None:
+        rng = random.Random()
+    xcoords, ycoords = list(range(size)), [0] * size
+    if size < 3:
+        return xcoords, ycoords
+    occupancy = {(x, 0): x for x in range(size)}
+
+    accepted = 0
+    attempts = 0
+    # The acceptance rate of the pivots decreases slowly with the size, the cap only guards against bad luck
+    while accepted < pivots and attempts < 100 * pivots:
+        attempts += 1
+        pivot = rng.randrange(1, size - 1)
+        symmetry = rng.choice(SYMMETRIES)
+        # The shorter part of the chain moves, the other part stays in place
+        if pivot < size // 2:
+            moved = range(pivot - 1, -1, -1)
+        else:
+            moved = range(pivot + 1, size)
+        px, py = xcoords[pivot], ycoords[pivot]
+
+        new_sites = []
+        for i in moved:
+            dx, dy = symmetry(xcoords[i] - px, ycoords[i] - py)
+            site = (px + dx, py + dy)
+            j = occupancy.get(site)
+            # A site taken by the moved part is left free by the pivot
+            if j is not None and (j > pivot) != (i > pivot):
+                break
+            new_sites.append(site)
+        else:
+            for i in moved:
+                del occupancy[(xcoords[i], ycoords[i])]
+            for i, (x, y) in zip(moved, new_sites):
+                xcoords[i], ycoords[i] = x, y
+                occupancy[(x, y)] = i
+            accepted += 1
+    return xcoords, ycoords
+
+
+def random_walks(size, count, rng=None, pivots=100):
+    """Generate count independent random self-avoiding walks of size amino acids, for multi-start runs"""
+    if rng is None:
+        rng = random.Random()
+    for _ in range(count):
+        yield random_walk(size, rng, pivots)
@@ -0,0 +1,157 @@
+SCHEDULES = ("constant", "linear", "geometric", "adaptive")
+
+
+class Schedule(object):
+    """
+        Temperature schedule of a Monte Carlo run, updated after every move. The base class keeps the starting
+        temperature, the subclasses cool the system down.
+
+        Every schedule can reheat: when the lowest energy seen has not improved for reheat_after moves, the
+        temperature goes back to the starting one and the cooling starts again, to leave the energy well the
+        run is stuck in.
+
+        Attributes:
+        - temperature: Current temperature (K), None or 0 for greedy descent.
+        - t_start: Starting temperature, also used by the reheats.
+        - reheat_after: Number of moves without improvement of the lowest energy before a reheat, 0 to never reheat.
+        - steps: Number of moves since the start or the last reheat.
+        - best_energy: Lowest energy seen.
+        - reheats: Number of reheats done.
+
+        Methods:
+        - update(accepted, energy): Account for a move and get the temperature of the next one.
+
+        """
+
+    def __init__(self, t_start, reheat_after=0):
+        """Schedule starting at the temperature t_start"""
+        self.t_start = t_start
+        self.temperature = t_start
+        self.reheat_after = reheat_after
+        self.steps = 0
+        self.best_energy = None
+        self.reheats = 0
+        self._stalled = 0
+
+    def update(self, accepted, energy):
+        """Account for a move (whether it was accepted and the energy after it), returns the temperature of
+        the next move"""
+        self.steps += 1
+        if self.best_energy is None or energy < self.best_energy:
+            self.best_energy = energy
+            self._stalled = 0
+        else:
+            self._stalled += 1
+
+        if self.reheat_after and self._stalled >= self.reheat_after:
+            self.reheats += 1
+            self.steps = 0
+            self._stalled = 0
+            self.temperature = self.t_start
+            self._reheat()
+        else:
+            self.temperature = self._next_temperature(accepted)
+        return self.temperature
+
+    def _next_temperature(self, accepted):
+        """Temperature of the next move, constant for the base class"""
+        return self.temperature
+
+    def _reheat(self):
+        """Reset the state of the schedule after a reheat"""
+
+
+class LinearSchedule(Schedule):
+    """Temperature decreasing linearly from t_start to t_end in n_steps moves, then staying at t_end"""
+
+    def __init__(self, t_start, t_end, n_steps, reheat_after=0):
+        super().__init__(t_start, reheat_after)
+        self.t_end = t_end
+        self.n_steps = n_steps
+
+    def _next_temperature(self, accepted):
+        progress = min(1.0, self.steps / self.n_steps)
+        return self.t_start + (self.t_end - self.t_start) * progress
+
+
+class GeometricSchedule(Schedule):
+    """Temperature multiplied by a constant factor after every move, from t_start to t_end in n_steps moves,
+    then staying at t_end"""
+
+    def __init__(self, t_start, t_end, n_steps, reheat_after=0):
+        if t_start <= 0 or t_end <= 0:
+            raise ValueError("A geometric schedule needs positive temperatures")
+        super().__init__(t_start, reheat_after)
+        self.t_end = t_end
+        self.n_steps = n_steps
+
+    def _next_temperature(self, accepted):
+        progress = min(1.0, self.steps / self.n_steps)
+        return self.t_start * (self.t_end / self.t_start) ** progress
+
+
+class AdaptiveSchedule(Schedule):
+    """
+        Temperature adjusted to keep the acceptance rate of the moves close to a target: after every window of
+        moves, the temperature is divided by factor if more moves than the target were accepted, multiplied by
+        factor otherwise, within [t_min, t_max].
+
+        """
+
+    def __init__(self, t_start, target=0.3, window=500, factor=1.05, t_min=1.0, t_max=None, reheat_after=0):
+        if t_start <= 0:
+            raise ValueError("An adaptive schedule needs a positive temperature")
+        super().__init__(t_start, reheat_after)
+        self.target = target
+        self.window = window
+        self.factor = factor
+        self.t_min = t_min
+        self.t_max = t_max if t_max is not None else 2 * t_start
+        self._accepted = 0
+        self._moves = 0
+
+    def _next_temperature(self, accepted):
+        self._moves += 1
+        self._accepted += accepted
+        if self._moves < self.window:
+            return self.temperature
+        rate = self._accepted / self._moves
+        self._reheat()
+        if rate > self.target:
+            return max(self.t_min, self.temperature / self.factor)
+        return min(self.t_max, self.temperature * self.factor)
+
+    def _reheat(self):
+        self._accepted = 0
+        self._moves = 0
+
+
+def build_schedule(name, t_start, t_end=None, n_steps=None, target=0.3, reheat_after=0):
+    """
+        Create a schedule from its name, for the command line programs.
+
+        Args:
+        - name (str): One of SCHEDULES.
+        - t_start (float): Starting temperature (K), None for greedy descent with the constant schedule.
+        - t_end (float): Final temperature of the linear and geometric schedules, t_start / 100 by default.
+        - n_steps (int): Number of moves of the cooling of the linear and geometric schedules.
+        - target (float): Acceptance rate targeted by the adaptive schedule.
+        - reheat_after (int): Number of moves without improvement before a reheat, 0 to never reheat.
+
+        Returns:
+        - Schedule: The schedule.
+
+        """
+    if name == "constant":
+        return Schedule(t_start, reheat_after)
+    if not t_start:
+        raise ValueError(f"The {name} schedule needs a starting temperature")
+    if t_end is None:
+        t_end = t_start / 100
+    if name == "linear":
+        return LinearSchedule(t_start, t_end, n_steps, reheat_after)
+    if name == "geometric":
+        return GeometricSchedule(t_start, t_end, n_steps, reheat_after)
+    if name == "adaptive":
+        return AdaptiveSchedule(t_start, target, reheat_after=reheat_after)
+    raise ValueError(f"Unknown schedule {name}, should be one of {', '.join(SCHEDULES)}")
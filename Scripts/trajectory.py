@@ -0,0 +1,160 @@
+import struct
+from array import array
+from collections import deque
+
+TRAJECTORY_MAGIC = b"HPTRAJ01"
+# Magic, number of amino acids, 1 if the conformations are recorded, stride
+HEADER = struct.Struct("<8sIBI")
+# Iteration, energy, 1 if the move was accepted
+RECORD = struct.Struct("<qiB")
+
+
+class TrajectoryRecorder(object):
+    """
+        Append-only binary trajectory file. Every record has the same size, so the file can be read back
+        record by record with read_trajectory() or memory-mapped with numpy (see trajectory_dtype()).
+
+        The file starts with a header (magic, number of amino acids, conformation flag, stride) followed by one
+        record every stride iterations: iteration (int64), energy (int32), accepted flag (uint8), then
+        optionally the x and y coordinates of every amino acid (int32).
+
+        Methods:
+        - record(iteration, energy, accepted, state): Write a record if the iteration is a multiple of the stride.
+        - tell(): Get the size of the data written, to truncate the file when a run is resumed.
+        - close(): Flush and close the file.
+
+        """
+
+    def __init__(self, name, size, stride=1, conformations=False, resume_offset=None):
+        """
+            Open a trajectory file.
+
+            Args:
+            - name (str): The name of the trajectory file.
+            - size (int): The number of amino acids of the chain.
+            - stride (int): Number of iterations between two records.
+            - conformations (bool): If True, the coordinates are written with each record.
+            - resume_offset (int): If given, reopen an existing file and drop what was written after this offset.
+
+            """
+        self.stride = stride
+        self.conformations = conformations
+        self.size = size
+        if resume_offset is None:
+            self._file = open(name, "wb")
+            self._file.write(HEADER.pack(TRAJECTORY_MAGIC, size, int(conformations), stride))
+        else:
+            self._file = open(name, "r+b")
+            self._file.truncate(resume_offset)
+            self._file.seek(resume_offset)
+
+    def record(self, iteration, energy, accepted, state=None):
+        """Write a record if the iteration is a multiple of the stride"""
+        if iteration % self.stride:
+            return
+        self._file.write(RECORD.pack(iteration, energy, accepted))
+        if self.conformations:
+            self._file.write(state.xcoords.tobytes())
+            self._file.write(state.ycoords.tobytes())
+
+    def tell(self):
+        """Get the size of the data written so far"""
+        self._file.flush()
+        return self._file.tell()
+
+    def close(self):
+        """Flush and close the file"""
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_trajectory(name):
+    """
+    Read a trajectory file written by TrajectoryRecorder, record by record.
+
+    Args:
+    - name (str): The name of the trajectory file.
+
+    Yields:
+    - tuple: Iteration, energy, accepted flag and the (x, y) coordinates, or None if they were not recorded.
+
+    """
+    with open(name, "rb") as filin:
+        magic, size, conformations, stride = HEADER.unpack(filin.read(HEADER.size))
+        if magic != TRAJECTORY_MAGIC:
+            raise ValueError(f"{name} is not a trajectory file")
+        coords_size = 4 * size if conformations else 0
+        while True:
+            data = filin.read(RECORD.size + 2 * coords_size)
+            if len(data) < RECORD.size + 2 * coords_size:
+                break
+            iteration, energy, accepted = RECORD.unpack_from(data)
+            coordinates = None
+            if conformations:
+                xcoords = array('i', data[RECORD.size:RECORD.size + coords_size])
+                ycoords = array('i', data[RECORD.size + coords_size:])
+                coordinates = (xcoords, ycoords)
+            yield iteration, energy, bool(accepted), coordinates
+
+
+def trajectory_dtype(size, conformations):
+    """numpy dtype of the records, to memory-map a trajectory with
+    numpy.memmap(name, dtype=trajectory_dtype(size, conformations), mode="r", offset=HEADER.size)"""
+    import numpy as np
+
+    fields = [("iteration", "<i8"), ("energy", "<i4"), ("accepted", "u1")]
+    if conformations:
+        fields += [("x", "<i4", (size,)), ("y", "<i4", (size,))]
+    return np.dtype(fields)
+
+
+class EnergyHistory(object):
+    """
+        Bounded memory history of the energy, for the energy plot of long runs.
+
+        In "downsample" mode every other point is dropped when the history is full and the sampling step
+        is doubled, so the history always covers the whole run. In "ring" mode only the last points are kept.
+
+        Attributes:
+        - iterations: Iterations of the points kept.
+        - energies: Energies of the points kept.
+
+        """
+
+    def __init__(self, capacity=10000, mode="downsample"):
+        """Create an empty history keeping at most capacity points"""
+        if mode not in ("downsample", "ring"):
+            raise ValueError(f"Invalid history mode {mode}, should be 'downsample' or 'ring'")
+        self.capacity = capacity
+        self.mode = mode
+        self.step = 1
+        self._seen = 0
+        if mode == "ring":
+            self.iterations = deque(maxlen=capacity)
+            self.energies = deque(maxlen=capacity)
+        else:
+            self.iterations = []
+            self.energies = []
+
+    def append(self, iteration, energy):
+        """Add a point to the history"""
+        self._seen += 1
+        if self.mode == "downsample":
+            if (self._seen - 1) % self.step:
+                return
+            if len(self.energies) >= self.capacity:
+                del self.iterations[1::2]
+                del self.energies[1::2]
+                self.step *= 2
+                if (self._seen - 1) % self.step:
+                    return
+        self.iterations.append(iteration)
+        self.energies.append(energy)
+
+    def __len__(self):
+        return len(self.energies)